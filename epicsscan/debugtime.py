@@ -4,15 +4,18 @@ from __future__ import print_function
 import time
 
 class debugtime(object):
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, enabled=True):
         self.clear()
         self.verbose = verbose
+        self.enabled = enabled
         self.add('init')
 
     def clear(self):
         self.times = []
 
     def add(self,msg=''):
+        if not self.enabled:
+            return
         if self.verbose:
             print(msg, time.ctime())
         self.times.append((msg,time.time()))
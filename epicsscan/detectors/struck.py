@@ -237,13 +237,11 @@ class Struck(Device):
         buff.append("#%s" % ("-"*60))
         buff.append("# %s" % ' | '.join(names))
 
-        fmt  = ''.join(fmts)
-        for i in range(npts):
-            buff.append(fmt.format(*sdata[i]))
+        fmt  = ''.join(fmts).format
+        buff.extend([fmt(*row) for row in sdata[:npts]])
         buff.append('')
-        fout = open(filename, 'w')
-        fout.write("\n".join(buff))
-        fout.close()
+        with open(filename, 'w') as fout:
+            fout.write("\n".join(buff))
         return (nmcas, npts)
 
     def get_arraydata(self, npts=None, **kws):
@@ -18,6 +18,19 @@ class EpicsScanDB(epics.Device):
         self._prefix = prefix
         epics.Device.__init__(self, self._prefix, attrs=self._attrs)
 
+    def wait_for_connection(self, timeout=2.0):
+        "wait for all PVs to connect, returning whether all are connected"
+        t0 = time.time()
+        for pv in self._pvs.values():
+            pv.wait_for_connection(timeout=max(0.001, t0 + timeout - time.time()))
+        return all(pv.connected for pv in self._pvs.values())
+
+    def put_many(self, values, wait=False):
+        """put several values at once, from a dict of {attr: value},
+        without waiting for each put to complete in turn"""
+        pvnames = [f'{self._prefix}{attr}' for attr in values]
+        return epics.caput_many(pvnames, list(values.values()), wait=wait)
+
     def setTime(self, ts=None):
         "Set Time"
         if ts is None:
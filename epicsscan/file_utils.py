@@ -26,6 +26,8 @@ else:
 
 BAD_FILECHARS = ';~,`!%$@?*#:"/|\'\\\t\r\n (){}[]<>'
 BAD_FILETABLE = maketrans(BAD_FILECHARS, '_'*len(BAD_FILECHARS))
+BAD_VARCHARS = BAD_FILECHARS + '.-'
+BAD_VARTABLE = maketrans(BAD_VARCHARS, '_'*len(BAD_VARCHARS))
 
 def get_timestamp():
     """return ISO format of current timestamp:
@@ -49,21 +51,15 @@ def get_homedir():
 
 def fix_varname(s):
     """fix string to be a 'good' variable name."""
-    t = str(s).translate(BAD_FILETABLE)
-    t = t.replace('.', '_').replace('-', '_')
-    while t.endswith('_'): t = t[:-1]
-    return t
+    return str(s).translate(BAD_VARTABLE).rstrip('_')
 
 def fix_filename(s):
     """fix string to be a 'good' filename.
     This may be a more restrictive than the OS, but
     avoids nasty cases."""
-    t = str(s).translate(BAD_FILETABLE)
-    if t.count('.') > 1:
-        for i in range(t.count('.') - 1):
-            idot = t.find('.')
-            t = "%s_%s" % (t[:idot], t[idot+1:])
-    return t
+    # keep only the last '.'
+    head, dot, tail = str(s).translate(BAD_FILETABLE).rpartition('.')
+    return head.replace('.', '_') + dot + tail
 
 def unixpath(d):
     d = d.replace('\\','/')
@@ -176,6 +176,7 @@ class StepScan(object):
         self.verified = False
         self.abort = False
         self.pause = False
+        self.interrupt_time = 0
         self.inittime = 0 # time to initialize scan (pre_scan, move to start, begin i/o)
         self.looptime = 0 # time to run scan loop (even if aborted)
         self.exittime = 0 # time to complete scan (post_scan, return positioners, complete i/o)
@@ -210,8 +211,12 @@ class StepScan(object):
     def set_info(self, attr, value):
         """set scan info to _scan variable"""
         if self.scandb is not None:
-            self.scandb.set_info(attr, value)
-            self.scandb.set_info('heartbeat', time.ctime())
+            self.scandb.set_infos({attr: value, 'heartbeat': time.ctime()})
+
+    def set_infos(self, infos):
+        """set several scan info values (with heartbeat) at once"""
+        if self.scandb is not None:
+            self.scandb.set_infos(dict(infos, heartbeat=time.ctime()))
 
     def open_output_file(self, filename=None, comments=None):
         """opens the output file"""
@@ -532,15 +537,37 @@ class StepScan(object):
             return self.scandb.get_info(key, as_bool=True)
         return False
 
-    def look_for_interrupts(self):
+    def wait_for_arm(self, timeout=2.0):
+        """wait for all detectors to be armed, checking only
+        detectors not yet armed.  Returns whether all are armed.
+        """
+        tout = time.time() + timeout
+        waiting = list(self.detectors)
+        while True:
+            waiting = [det for det in waiting if not det.arm_complete()]
+            if len(waiting) == 0 or time.time() > tout:
+                break
+            time.sleep(0.005)
+        return len(waiting) == 0
+
+    def look_for_interrupts(self, max_age=0):
         """set interrupt requests:
 
         abort / pause / resume
-        if scandb is being used, these are looked up from database.
+        if scandb is being used, these are looked up from database,
+        unless the last lookup is less than max_age seconds old.
         """
-        self.abort  = self.get_infobool('request_abort')
-        self.pause  = self.get_infobool('request_pause')
-        self.resume = self.get_infobool('request_resume')
+        now = time.time()
+        if max_age > 0 and now < self.interrupt_time + max_age:
+            return self.abort
+        self.interrupt_time = now
+        self.abort = self.pause = self.resume = False
+        if self.scandb is not None:
+            reqs = self.scandb.get_infos(('request_abort', 'request_pause',
+                                          'request_resume'), as_bool=True)
+            self.abort  = reqs.get('request_abort', False)
+            self.pause  = reqs.get('request_pause', False)
+            self.resume = reqs.get('request_resume', False)
         return self.abort
 
     def write(self, msg):
@@ -554,6 +581,7 @@ class StepScan(object):
         if scandb is being used, these are looked up from database.
         """
         self.abort = self.pause = self.resume = False
+        self.interrupt_time = 0
         self.set_info('request_abort', 0)
         self.set_info('request_pause', 0)
         self.set_info('request_resume', 0)
@@ -51,6 +51,13 @@ def isotime2datetime(xisotime):
     susec = int(1e6*float('.%s' % sfrac))
     return datetime(syear, smon, sday, shour, smin, ssec, susec)
 
+def as_float(val):
+    "convert value to float if possible, otherwise return unchanged"
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return val
+
 def make_datetime(t=None, iso=False):
     """unix timestamp to datetime iso format
     if t is None, current time is used"""
@@ -160,6 +167,10 @@ class ScanDB(SimpleDB):
         """add message to slewscanstatus table"""
         self.insert('slewscanstatus', text=text)
 
+    def add_slewscanstatus_lines(self, textlines):
+        """add list of messages to slewscanstatus table"""
+        self.insert_many('slewscanstatus', [{'text': t} for t in textlines])
+
     def clear_slewscanstatus(self, **kws):
         self.delete_rows('slewscanstatus', where=True)
 
@@ -377,6 +388,16 @@ class ScanDB(SimpleDB):
         """return slewscan positioner by name"""
         return self.getrow('slewscanpositioners', name)
 
+    def get_slewpositioner_config(self, name):
+        """return config row for a slewscan positioner by name,
+        in a single query joining slewscanpositioners and config"""
+        pos = self.tables['slewscanpositioners']
+        conf = self.tables['config']
+        query = (conf.select()
+                 .join_from(conf, pos, pos.c.config_id == conf.c.id)
+                 .where(pos.c.name == name))
+        return self.execute(query).fetchone()
+
     def add_slewpositioner(self, name, drivepv, readpv=None, notes='',
                            extrapvs=None, **kws):
         """add slewscan positioner"""
@@ -889,18 +910,12 @@ class InstrumentDB(object):
         if exclude_pvs is None:
             exclude_pvs = []
 
-        pv_vals = []
-        for row in self.scandb.get_rows('position_pv', where={'position_id': pos.id}):
-            if row.pv_id not in self.pvmap:
-                self.make_pvmap()
-            pvname = self.pvmap[row.pv_id]
-            if pvname not in exclude_pvs:
-                val = row.value
-                try:
-                    val = float(val)
-                except ValueError:
-                    pass
-                pv_vals.append((epics.get_pv(pvname), val))
+        rows = self.scandb.get_rows('position_pv', where={'position_id': pos.id})
+        if any(row.pv_id not in self.pvmap for row in rows):
+            self.make_pvmap()
+        pvmap = self.pvmap
+        pv_vals = [(epics.get_pv(pvmap[row.pv_id]), as_float(row.value))
+                   for row in rows if pvmap[row.pv_id] not in exclude_pvs]
 
         time.sleep(0.01)
         # put values without waiting
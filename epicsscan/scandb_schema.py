@@ -9,8 +9,8 @@ import logging
 from .simpledb import SimpleDB
 
 from sqlalchemy import (MetaData, create_engine, text, Table, Column,
-                        ColumnDefault, ForeignKey, Integer, Float, String,
-                        Text, DateTime, UniqueConstraint)
+                        ForeignKey, Integer, Float, String,
+                        Text, DateTime, UniqueConstraint, Index)
 
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects import postgresql
@@ -60,8 +60,23 @@ def PointerCol(name, other=None, keyid='id', **kws):
     return Column("%s_%s" % (name, keyid), None,
                   ForeignKey('%s.%s' % (other, keyid)), **kws)
 
+def TimeCol(name, server='postgresql', **kws):
+    """DateTime column defaulting to the current local time.
+    ScanDB works on reflected tables, which do not carry the Python-side
+    default, so a server-side default for the local time (of the database
+    session) is also set."""
+    now = 'LOCALTIMESTAMP'
+    if server.startswith('sqlite'):
+        now = "(datetime('now', 'localtime'))"
+    return Column(name, DateTime, default=datetime.now,
+                  server_default=text(now), **kws)
+
+def MTimeCol(name='modify_time', server='postgresql', **kws):
+    return TimeCol(name, server=server, onupdate=datetime.now, **kws)
+
 def NamedTable(tablename, metadata, keyid='id', nameid='name', name_unique=True,
-               name=True, notes=True, with_pv=False, with_use=False, cols=None):
+               name=True, notes=True, with_pv=False, with_use=False,
+               with_mtime=False, server='postgresql', cols=None):
     args  = [Column(keyid, Integer, primary_key=True)]
     if name:
         args.append(StrCol(nameid, size=512, nullable=False, unique=name_unique))
@@ -73,6 +88,8 @@ def NamedTable(tablename, metadata, keyid='id', nameid='name', name_unique=True,
         args.append(IntCol('use', default=1))
     if cols is not None:
         args.extend(cols)
+    if with_mtime:
+        args.append(MTimeCol(server=server))
     return Table(tablename, metadata, *args)
 
 def create_scandb(dbname, server='postgresql', create=True,
@@ -109,14 +126,14 @@ def create_scandb(dbname, server='postgresql', create=True,
                  Column('key', Text, primary_key=True, unique=True),
                  StrCol('notes'),
                  StrCol('value'),
-                 Column('modify_time', DateTime, default=datetime.now),
-                 Column('create_time', DateTime, default=datetime.now),
+                 MTimeCol(server=server),
+                 TimeCol('create_time', server=server),
                  IntCol('display_order')           )
 
     messages = Table('messages', metadata,
                  Column('id', Integer, primary_key=True),
                  StrCol('text'),
-                 Column('modify_time', DateTime, default=datetime.now))
+                 MTimeCol(server=server))
 
     common_commands = NamedTable('common_commands', metadata,
                                  cols=[StrCol('args'),
@@ -143,17 +160,16 @@ def create_scandb(dbname, server='postgresql', create=True,
                               StrCol('options')])
 
     detconf = NamedTable('scandetectorconfig', metadata,
+                         with_mtime=True, server=server,
                          cols=[StrCol('kind', size=128),
                                StrCol('text'),
-                               PointerCol('scandetectors'),
-                               Column('modify_time', DateTime, default=datetime.now),
-                         ])
+                               PointerCol('scandetectors')])
 
     scans = NamedTable('scandefs', metadata,
+                       with_mtime=True, server=server,
                        cols=[StrCol('text'),
                              StrCol('type'),
-                             Column('modify_time', DateTime),
-                             Column('last_used_time', DateTime)])
+                             TimeCol('last_used_time', server=server)])
 
     extrapvs = NamedTable('extrapvs', metadata, with_pv=True, with_use=True)
 
@@ -163,33 +179,32 @@ def create_scandb(dbname, server='postgresql', create=True,
                               StrCol('output')])
 
     cmds = NamedTable('commands', metadata, name=False,
+                      with_mtime=True, server=server,
                       cols=[StrCol('command'),
                             StrCol('arguments'),
                             PointerCol('status', default=1),
                             IntCol('nrepeat',  default=1),
                             IntCol('run_order', default=1),
-                            Column('request_time', DateTime,
-                                   default=datetime.now),
+                            TimeCol('request_time', server=server),
                             Column('start_time',    DateTime),
-                            Column('modify_time',   DateTime,
-                                   default=datetime.now),
                             StrCol('output_value'),
                             StrCol('output_file')])
+    Index('ix_commands_status_runorder', cmds.c.status_id, cmds.c.run_order)
 
     pvtype = NamedTable('pvtype', metadata)
     pv     = NamedTable('pv', metadata, cols=[PointerCol('pvtype')])
 
     scandata = NamedTable('scandata', metadata, with_pv=True,
+                         with_mtime=True, server=server,
                          cols = [PointerCol('commands'),
                                  ArrayCol('data', server=server),
                                  StrCol('units', default=''),
-                                 StrCol('breakpoints', default=''),
-                                 Column('modify_time', DateTime)])
+                                 StrCol('breakpoints', default='')])
 
     slewscanstatus = Table('slewscanstatus', metadata,
                            Column('id', Integer, primary_key=True),
                            StrCol('text'),
-                           Column('modify_time', DateTime, default=datetime.now))
+                           MTimeCol(server=server))
 
     # instruments
     instrument = NamedTable('instrument', metadata, name_unique=True,
@@ -197,8 +212,8 @@ def create_scandb(dbname, server='postgresql', create=True,
                                   IntCol('display_order', default=0)])
 
     position  = NamedTable('position', metadata, name_unique=False,
-                           cols=[Column('modify_time', DateTime),
-                                 StrCol('image'),
+                           with_mtime=True, server=server,
+                           cols=[StrCol('image'),
                                  PointerCol('instrument'),
                                  UniqueConstraint('name', 'instrument_id', name='pos_inst_name')])
 
@@ -239,16 +254,5 @@ def create_scandb(dbname, server='postgresql', create=True,
                        ("request_shutdown", "0") ):
         db.set_info(key, value)
 
-    fnow = ColumnDefault(datetime.now)
-    for tname in ('info', 'messages', 'commands', 'position','scandefs',
-                  'scandata', 'slewscanstatus', 'scandetectorconfig',
-                  'commands'):
-        db.tables[tname].columns['modify_time'].onupdate =  fnow
-        db.tables[tname].columns['modify_time'].default =  fnow
-
-    for tname, cname in (('info', 'create_time'),
-                         ('commands', 'request_time'),
-                         ('scandefs', 'last_used_time')):
-        db.tables[tname].columns[cname].default = fnow
     print(f"Created database for epicsscan: '{dbname}'")
     return
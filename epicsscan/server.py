@@ -4,9 +4,13 @@ from __future__ import print_function
 
 import time, sys, os
 import json
+import logging
+from logging.handlers import RotatingFileHandler
+from threading import Event
 import numpy as np
 import glob
 import epics
+from sqlalchemy import bindparam
 
 from .scandb import ScanDB, make_datetime
 from .file_utils import fix_varname, nativepath
@@ -19,14 +23,40 @@ from .epics_scandb import EpicsScanDB
 # from .abort_slewscan import abort_slewscan
 
 DEBUG_TIMER = False
+HEARTBEAT_TIME = 0.75
+POLL_TIME = 0.5
+HOSTPID_TIME = 10.0
+
+logger = logging.getLogger('epicsscan.server')
+
+def setup_logging(logfile=None):
+    """send server log messages to stdout, and optionally
+    to a rotating log file"""
+    if len(logger.handlers) > 0:
+        return
+    formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s',
+                                  datefmt='%Y-%m-%d %H:%M:%S')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if logfile is not None:
+        handlers.append(RotatingFileHandler(logfile, maxBytes=2**22,
+                                            backupCount=5))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
 class ScanServer():
-    def __init__(self, dbname=None,  **kws):
+    def __init__(self, dbname=None, server_log=None, **kws):
         self.epicsdb = None
         self.scandb = None
         self.abort = False
         self.command_in_progress = False
         self.req_shutdown = False
+        self.interrupt_pvs = {}
+        self.hostpid_time = 0
+        self.wake_event = Event()
+        setup_logging(server_log)
         self.connect(dbname, **kws)
 
     def connect(self, dbname, **kws):
@@ -35,13 +65,12 @@ class ScanServer():
 
         self.set_scan_message('Server Initializing')
         self.scandb.set_hostpid()
-        self.scandb.set_info('request_abort',    0)
-        self.scandb.set_info('request_pause',    0)
-        self.scandb.set_info('request_shutdown', 0)
+        self.scandb.set_infos({'request_abort': 0, 'request_pause': 0,
+                               'request_shutdown': 0})
         self.set_workdir()
+        self.prepare_command_query()
 
         self.mkernel = MacroKernel(self.scandb, load_macros=True)
-        time.sleep(0.05)
         self.set_scan_message('Server Connected.')
         if 'startup' in self.mkernel.get_macros():
             self.scandb.add_command("startup()")
@@ -52,17 +81,32 @@ class ScanServer():
 
         if eprefix is not None:
             self.epicsdb = EpicsScanDB(prefix=eprefix)
-            time.sleep(0.1)
-            self.epicsdb.Shutdown = 0
-            self.epicsdb.Abort = 0
-            self.epicsdb.basedir = plain_ascii(basedir)
-            self.epicsdb.workdir = plain_ascii(workdir)
+            self.epicsdb.wait_for_connection(timeout=2.0)
+            self.epicsdb.put_many({'Shutdown': 0, 'Abort': 0,
+                                   'basedir': plain_ascii(basedir),
+                                   'workdir': plain_ascii(workdir)})
+            for attr in ('Abort', 'Shutdown'):
+                self.interrupt_pvs[attr] = self.epicsdb.PV(attr)
+                self.epicsdb.add_callback(attr, self.onInterruptPV)
+
+    def prepare_command_query(self):
+        """build the (re-used) query for requested commands, ordered by
+        run_order.  The index for this query is made by create_scandb()"""
+        commands = self.scandb.tables['commands']
+        self.pending_query = (commands.select()
+                              .where(commands.c.status_id == bindparam('status_id'))
+                              .order_by(commands.c.run_order))
+
+    def onInterruptPV(self, pvname=None, value=None, **kws):
+        "PV callback for Abort / Shutdown: wake up mainloop"
+        self.wake_event.set()
 
     def set_scan_message(self, msg, verbose=True):
         self.scandb.set_info('scan_message', msg)
         if self.epicsdb is not None:
             self.epicsdb.message = msg
-        print(msg)
+        if verbose:
+            logger.info(msg)
 
     def sleep(self, t=0.05):
         try:
@@ -72,11 +116,8 @@ class ScanServer():
 
     def finish(self):
         self.set_scan_message('Server Shutting Down')
-        self.scandb.set_info('request_pause',    0)
-        self.scandb.set_info('request_abort',    1)
-        self.scandb.set_info('request_abort',    0)
-        self.scandb.set_info('request_shutdown', 0)
-        time.sleep(0.025)
+        self.scandb.set_infos({'request_pause': 0, 'request_abort': 0,
+                               'request_shutdown': 0})
 
     def set_status(self, status):
         self.scandb.set_info('scan_status', status)
@@ -114,20 +155,21 @@ class ScanServer():
             return
 
         self.command_in_progress = True
-        self.set_status('starting')
-        self.scandb.set_command_status('starting', cmdid=cmdid)
-        self.set_scan_message(f"Executing: <{command}>")
+        with self.scandb.transaction():
+            self.set_status('starting')
+            self.scandb.set_command_status('starting', cmdid=cmdid)
+            self.set_scan_message(f"Executing: <{command}>")
+
+        args = strip_quotes(plain_ascii(cmd_row.arguments)).strip()
+        lcmd = command.lower()
+        if lcmd in ('scan', 'slewscan'):
+            notes = strip_quotes(plain_ascii(cmd_row.notes)).strip()
+            nrepeat = int(cmd_row.nrepeat)
+            filename = cmd_row.output_file
+            if filename is None:
+                filename = ''
+            filename = strip_quotes(plain_ascii(filename))
 
-        args    = strip_quotes(plain_ascii(cmd_row.arguments)).strip()
-        notes   = strip_quotes(plain_ascii(cmd_row.notes)).strip()
-        nrepeat = int(cmd_row.nrepeat)
-
-        filename = cmd_row.output_file
-        if filename is None:
-            filename = ''
-        filename = strip_quotes(plain_ascii(filename))
-
-        if command.lower() in ('scan', 'slewscan'):
             scanname = args
             words = ["'%s'" % scanname]
             if nrepeat > 1 and command != 'slewscan':
@@ -143,10 +185,10 @@ class ScanServer():
                                last_used_time= make_datetime())
             command = "do_%s" % command
             args = ', '.join(words)
-        elif command.lower().startswith('restart_scanserver'):
+        elif lcmd.startswith('restart_scanserver'):
             self.scandb.set_info('error_message',   '')
             self.scandb.set_info('request_shutdown', 1)
-        elif command.lower().startswith('load_macro'):
+        elif lcmd.startswith('load_macro'):
             self.scandb.set_info('error_message',   '')
             self.scandb.set_command_status('running', cmdid=cmdid)
             self.set_scan_message('Server reloading macros..')
@@ -157,15 +199,15 @@ class ScanServer():
                 cmd = command
             else:
                 cmd = "%s(%s)" % (command, args)
-            self.scandb.set_info('scan_progress', 'running')
-            self.scandb.set_info('error_message',   '')
-            self.scandb.set_info('current_command', cmd)
-            self.scandb.set_info('current_command_id', cmdid)
-            self.set_status('running')
-            self.scandb.set_command_status('running', cmdid=cmdid)
+            with self.scandb.transaction():
+                self.scandb.set_infos({'scan_progress': 'running',
+                                       'error_message': '',
+                                       'current_command': cmd,
+                                       'current_command_id': cmdid})
+                self.set_status('running')
+                self.scandb.set_command_status('running', cmdid=cmdid)
             if self.epicsdb is not None:
-                self.epicsdb.cmd_id = cmdid
-                self.epicsdb.command = cmd
+                self.epicsdb.put_many({'cmd_id': cmdid, 'command': cmd})
 
             msg = 'done'
             try:
@@ -173,7 +215,7 @@ class ScanServer():
                 out = self.mkernel.run(cmd)
             except:
                 pass
-            status, msg = 'finished', 'scan complete'
+            status, msg, emsg = 'finished', 'scan complete', None
             err = self.mkernel.get_error()
             if len(err) > 0:
                 err = err[0]
@@ -183,30 +225,36 @@ class ScanServer():
                     msg = 'scan aborted'
                 else:
                     emsg = '\n'.join(err.get_error())
-                    self.scandb.set_info('error_message', emsg)
                     msg = 'scan completed with error'
-            time.sleep(0.1)
-            self.scandb.set_info('scan_progress', msg)
-            self.scandb.set_command_status(status, cmdid=cmdid)
+            with self.scandb.transaction():
+                if emsg is not None:
+                    self.scandb.set_info('error_message', emsg)
+                self.scandb.set_info('scan_progress', msg)
+                self.scandb.set_command_status(status, cmdid=cmdid)
         self.set_status('idle')
         self.command_in_progress = False
 
     def look_for_interrupts(self):
         """look for aborts"""
-        get_info = self.scandb.get_info
-        self.req_abort = get_info('request_abort', as_bool=True)
-        self.req_pause = get_info('request_pause', as_bool=True)
-        self.req_shutdown = get_info('request_shutdown', as_bool=True)
-        if self.epicsdb is not None:
-            if self.epicsdb.Abort == 1:
+        reqs = self.scandb.get_infos(('request_abort', 'request_pause',
+                                      'request_shutdown'), as_bool=True)
+        self.req_abort = reqs.get('request_abort', False)
+        self.req_pause = reqs.get('request_pause', False)
+        self.req_shutdown = reqs.get('request_shutdown', False)
+        # monitored values: no Channel Access round-trip needed
+        if self.interrupt_pvs.get('Abort', None) is not None:
+            if self.interrupt_pvs['Abort'].value == 1:
                 self.req_abort = 1
-            if self.epicsdb.Shutdown == 1:
+            if self.interrupt_pvs['Shutdown'].value == 1:
                 self.req_shutdown = 1
 
-        if not self.scandb.check_hostpid():
-            print("No Longer Host, exiting")
-            time.sleep(5)
-            self.req_shutdown = 1
+        now = time.time()
+        if now > self.hostpid_time + HOSTPID_TIME:
+            self.hostpid_time = now
+            if not self.scandb.check_hostpid():
+                logger.error("No Longer Host, exiting")
+                time.sleep(5)
+                self.req_shutdown = 1
         return self.req_abort
 
     def clear_interrupts(self):
@@ -216,11 +264,9 @@ class ScanServer():
         otherwise local Macro variables are used.
         """
         self.req_abort = self.req_pause = False
-        self.scandb.set_info('request_abort', 0)
-        self.scandb.set_info('request_pause', 0)
+        self.scandb.set_infos({'request_abort': 0, 'request_pause': 0})
         if self.epicsdb is not None:
-            self.epicsdb.Abort = 0
-            self.epicsdb.Shutdown = 0
+            self.epicsdb.put_many({'Abort': 0, 'Shutdown': 0})
 
     def set_heartbeat(self):
         tmsg = tstamp()
@@ -236,14 +282,21 @@ class ScanServer():
         request_id = self.scandb.status_codes['requested']
 
         # Note: this loop is really just looking for new commands
-        # or interrupts, so does not need to go super fast.
+        # or interrupts, so does not need to go super fast: when idle,
+        # the database is polled only every POLL_TIME seconds (the
+        # heartbeat is updated on the first poll after HEARTBEAT_TIME).
+        # Epics Abort / Shutdown PVs will wake the loop immediately.
+        # After a command has run, look for the next one without waiting.
+        wait_time = POLL_TIME
         while True:
-            epics.poll(0.025, 1.0)
-            time.sleep(0.1)
+            if wait_time > 0:
+                self.wake_event.wait(timeout=wait_time)
+                self.wake_event.clear()
+            wait_time = POLL_TIME
             now = time.time()
 
             # update server heartbeat / message
-            if now > msgtime + 0.75:
+            if now > msgtime + HEARTBEAT_TIME:
                 msgtime = now
                 self.set_heartbeat()
 
@@ -255,13 +308,12 @@ class ScanServer():
 
             # pause: sleep, continue loop until un-paused
             if self.req_pause:
-                time.sleep(1.0)
+                wait_time = 1.0
                 continue
 
             # get ordered list of requested commands
-            cmds = self.scandb.get_rows('commands',
-                                        status=request_id,
-                                        order_by='run_order')
+            cmds = self.scandb.execute(self.pending_query,
+                                       {'status_id': request_id}).fetchall()
             # abort current command?
             if self.req_abort:
                 if len(cmds) > 0:
@@ -274,8 +326,7 @@ class ScanServer():
             # do next command
             if len(cmds) > 0:
                 self.do_command(cmds[0])
-            else:
-                time.sleep(0.25)
+                wait_time = 0
         # mainloop end
         self.finish()
         return None
@@ -7,10 +7,13 @@ import os
 import time
 import random
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-from sqlalchemy import MetaData, create_engine, text, and_
+from sqlalchemy import MetaData, create_engine, text, and_, event
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite, mysql
 from sqlalchemy.sql.sqltypes import INTEGER
 
 def get_credentials(credfile=None, envvar='ESCAN_CREDENTIALS', ):
@@ -49,6 +52,38 @@ password: db_user_password
                 conn[key] = val
     return conn
 
+SQLITE_PRAGMAS = ('journal_mode=WAL', 'synchronous=NORMAL',
+                  'temp_store=MEMORY', 'mmap_size=1073741824',
+                  'cache_size=-65536', 'busy_timeout=5000')
+
+def set_sqlite_pragmas(dbapi_conn, conn_record=None):
+    """set PRAGMAs for each new SQLite connection:
+    WAL journaling lets readers proceed during writes,
+    and synchronous=NORMAL avoids an fsync for every commit.
+    """
+    cursor = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
+# dialect-specific INSERT constructs that support 'upsert'
+UPSERT_INSERTS = {'postgresql': postgresql.insert,
+                  'sqlite': sqlite.insert,
+                  'mysql': mysql.insert}
+
+def cast_info(val, as_int=False, as_bool=False):
+    "cast info value to int or bool"
+    if (as_int or as_bool):
+        if val is None:
+            val = 0
+        try:
+            val = int(float(val))
+            if as_bool:
+                val = bool(val)
+        except (ValueError, TypeError):
+            pass
+    return val
+
 def isotime(dtime=None, sep=' '):
     if dtime is None:
         dtime = datetime.now()
@@ -69,8 +104,13 @@ class SimpleDB(object):
 
     connect(dbname, serve, user, password, port, host)
     close()
+    transaction()
     execute()
     set_info()
+    set_infos()
+    get_infos()
+    info_upsert()
+    insert_many()
     get_rows()
 
     """
@@ -79,6 +119,8 @@ class SimpleDB(object):
         self.engine = None
         self.metadata = None
         self.logfile = logfile
+        self._local = threading.local()
+        self._info_upserts = {}
         if dbname is not None:
             self.connect(dbname, server=server, user=user,
                          password=password, port=port, host=host, dialect=dialect)
@@ -115,6 +157,8 @@ class SimpleDB(object):
             connect_str = f'{server}+{dialect}://{connect_str}'
 
         self.engine = create_engine(connect_str, connect_args=connect_args)
+        if server == 'sqlite' and dbname not in ('', ':memory:'):
+            event.listen(self.engine, 'connect', set_sqlite_pragmas)
         self.metadata = MetaData()
         try:
             self.metadata.reflect(bind=self.engine)
@@ -137,14 +181,36 @@ class SimpleDB(object):
         with Session(self.engine) as session, session.begin():
             session.flush()
 
-    def execute(self, query, set_modify_date=False):
+    @contextmanager
+    def transaction(self):
+        """context manager to run several queries in a single transaction,
+        committed on exit:
+
+        >>> with db.transaction():
+        ...     db.set_info('scan_status', 'running')
+        ...     db.update('commands', where={'id': 3}, status_id=5)
+
+        transactions are per-thread, and nested calls join the outer one.
         """
-        general execute of query, optionally setting 'modify date'
-        and committing
+        session = getattr(self._local, 'session', None)
+        if session is not None:
+            yield session
+            return
+        with Session(self.engine) as session, session.begin():
+            self._local.session = session
+            try:
+                yield session
+            finally:
+                self._local.session = None
+
+    def execute(self, query, params=None, set_modify_date=False):
+        """
+        general execute of query, with optional dict of bound parameters,
+        optionally setting 'modify date' and committing
         """
         result = None
-        with Session(self.engine) as session, session.begin():
-            result = session.execute(query)
+        with self.transaction() as session:
+            result = session.execute(query, params)
             if set_modify_date:
                 q = self.set_info('modify_date', isotime(), do_execute=False)
                 if q is not None:
@@ -158,13 +224,14 @@ class SimpleDB(object):
         use do_execute=False to avoid executing, and return the query
         """
         tab = self.tables['info']
-        val = self.get_rows('info', where={'key': key}, none_if_empty=True)
         ivals = {'value': value}
         if with_modify_time and 'modify_time' in tab.c:
             ivals['modify_time'] = isotime()
-        if val is None:
-            ivals['key'] = key
-            query = tab.insert().values(**ivals)
+        query = self.info_upsert(with_modify_time=with_modify_time)
+        if query is not None:
+            query = query.values(key=key, **ivals)
+        elif self.get_rows('info', where={'key': key}, none_if_empty=True) is None:
+            query = tab.insert().values(key=key, **ivals)
         else:
             query = tab.update().where(tab.c.key==key).values(**ivals)
         if do_execute:
@@ -172,6 +239,51 @@ class SimpleDB(object):
             return
         return query
 
+    def set_infos(self, infos, with_modify_time=True):
+        """set several key / value pairs in the info table
+        in a single transaction
+
+        infos: dict of {key: value}
+        """
+        query = self.info_upsert(with_modify_time=with_modify_time)
+        if query is None:
+            with self.transaction():
+                for key, value in infos.items():
+                    self.set_info(key, value, with_modify_time=with_modify_time)
+            return
+        rows = []
+        mtime = with_modify_time and 'modify_time' in self.tables['info'].c
+        for key, value in infos.items():
+            row = {'key': key, 'value': value}
+            if mtime:
+                row['modify_time'] = isotime()
+            rows.append(row)
+        self.execute(query, rows, set_modify_date=True)
+
+    def info_upsert(self, with_modify_time=True):
+        """return statement to insert or update (on key) a row of the
+        info table, or None if the database does not support this.
+        """
+        if with_modify_time not in self._info_upserts:
+            tab = self.tables['info']
+            dialect = self.engine.dialect.name
+            insert = UPSERT_INSERTS.get(dialect, None)
+            query = None
+            if insert is not None:
+                query = insert(tab)
+                cols = ['value']
+                if with_modify_time and 'modify_time' in tab.c:
+                    cols.append('modify_time')
+                if dialect == 'mysql':
+                    query = query.on_duplicate_key_update(
+                        {c: query.inserted[c] for c in cols})
+                else:
+                    query = query.on_conflict_do_update(
+                        index_elements=[tab.c.key],
+                        set_={c: query.excluded[c] for c in cols})
+            self._info_upserts[with_modify_time] = query
+        return self._info_upserts[with_modify_time]
+
     def get_info(self, key=None, default=None, prefix=None, as_int=False,
                  as_bool=False, order_by='modify_time', full_row=False):
         where = {}
@@ -181,18 +293,7 @@ class SimpleDB(object):
         if order_by in self.tables['info'].c:
             gi_kws['order_by'] = order_by
         allrows = self.get_rows('info', where, **gi_kws)
-
-        def cast(val, as_int, as_bool):
-            if (as_int or as_bool):
-                if val is None:
-                    val = 0
-                try:
-                    val = int(float(val))
-                    if as_bool:
-                        val = bool(val)
-                except (ValueError, TypeError):
-                    pass
-            return val
+        cast = cast_info
 
         if prefix is None:
             if len(allrows) == 1:
@@ -222,6 +323,16 @@ class SimpleDB(object):
                     out[row.key] = cast(xout, as_int, as_bool)
         return out
 
+    def get_infos(self, keys, as_int=False, as_bool=False):
+        """get values for several keys from the info table
+        with a single query, returning a dict of {key: value}
+
+        keys not found in the info table are not included
+        """
+        tab = self.tables['info']
+        rows = self.execute(tab.select().where(tab.c.key.in_(keys))).fetchall()
+        return {row.key: cast_info(row.value, as_int, as_bool) for row in rows}
+
     def set_modify_time(self):
         """set modify_date in info table"""
         self.set_info('modify_date', isotime(), do_execute=True)
@@ -235,6 +346,13 @@ class SimpleDB(object):
         tab = self.tables[tablename]
         self.execute(tab.insert().values(**kws), set_modify_date=True)
 
+    def insert_many(self, tablename, rows):
+        """insert several rows to a table in one statement,
+        with rows a list of dicts of keyword/value pairs"""
+        if len(rows) > 0:
+            tab = self.tables[tablename]
+            self.execute(tab.insert(), list(rows), set_modify_date=True)
+
     def table_error(self, message, tablename, funcname):
         raise ValueError(f"{message} for table '{tablename}' in {funcname}()")
 
@@ -5,20 +5,23 @@ Slew Scan based on EpicsApps.StepScan.
 import sys
 import os
 import json
-import shutil
 import time
+import queue
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
 import numpy as np
 
 from .scan import StepScan
 from .positioner import Positioner
 from .saveable import Saveable
 
-from .utils import ScanDBAbort
+from .utils import ScanDBAbort, step_size
+from .simpledb import cast_info
 from .detectors import (Counter, Trigger, AreaDetector, write_poni)
 from .file_utils import fix_varname, fix_filename, increment_filename
 
-from epics import PV, poll, get_pv, caget, caput
+from epics import poll, get_pv, caget, caput_many
 from newportxps import NewportXPS
 
 from .debugtime import debugtime
@@ -37,36 +40,54 @@ class Slew_Scan(StepScan):
         self.detmode  = 'ndarray'
         self.motor_vals = {}
         self.orig_positions = {}
+        self.mappref = None
+        self.map_pvs = {}
         self.postscan_func = self.post_slew_scan
 
     def prepare_scan(self):
         """prepare slew scan"""
         self.set_info('scan_progress', 'preparing')
+        # read settings used for the scan together, and only once
+        infos = self.scandb.get_infos(('zero_finemotors_beforemap',
+                                       'server_fileroot', 'user_folder',
+                                       'epics_map_prefix'))
+        positioners = self.scandb.get_positioners()
 
         # ZeroFineMotors before map?
-        if self.scandb.get_info('zero_finemotors_beforemap', as_bool=True):
+        if cast_info(infos.get('zero_finemotors_beforemap'), as_bool=True):
             zconf = self.scandb.get_config('zero_finemotors')
             zconf = json.loads(zconf.notes)
             vals  = dict(finex=0.0, finey=0.0, coarsex=0.0, coarsey=0.0)
             pvs   = dict(finex=None, finey=None, coarsex=None, coarsey=None)
-            for pos in self.scandb.get_positioners():
+            # create all PVs first so that they connect concurrently
+            for pos in positioners:
                 pname = str(pos.name.lower().replace(' ', ''))
                 if pname in vals:
-                    pvs[pname]  = PV(pos.drivepv)
-                    vals[pname] = caget(pos.drivepv)
-            if abs(vals['finex']) > 1.e-5 and pvs['coarsex'] is not None:
-                coarsex = vals['coarsex'] + float(zconf['finex_scale']) * vals['finex']
-                pvs['coarsex'].put(coarsex, wait=True)
-            if abs(vals['finey']) > 1.e-5 and pvs['coarsey'] is not None:
-                coarsey = vals['coarsey'] + float(zconf['finey_scale']) * vals['finey']
-                pvs['coarsey'].put(coarsey, wait=True)
-            time.sleep(0.1)
-            pvs['finex'].put(0, wait=True)
-            pvs['finey'].put(0, wait=True)
-            time.sleep(0.1)
-        inner_pos = self.scandb.get_slewpositioner(self.inner[0])
-        conf = self.scandb.get_config_id(inner_pos.config_id)
+                    pvs[pname]  = get_pv(pos.drivepv)
+            for pname, thispv in pvs.items():
+                if thispv is not None:
+                    vals[pname] = thispv.get()
+            # move coarse motors together, then zero fine motors together,
+            # each time waiting for all puts to complete
+            coarse_pvs, coarse_vals, fine_pvs = [], [], []
+            for ax in ('x', 'y'):
+                fine = vals['fine'+ax]
+                if abs(fine) > 1.e-5:
+                    fine_pvs.append(pvs['fine'+ax].pvname)
+                    if pvs['coarse'+ax] is not None:
+                        coarse_pvs.append(pvs['coarse'+ax].pvname)
+                        coarse_vals.append(vals['coarse'+ax] +
+                                           float(zconf['fine%s_scale' % ax]) * fine)
+            if len(coarse_pvs) > 0:
+                caput_many(coarse_pvs, coarse_vals, wait='all')
+            if len(fine_pvs) > 0:
+                caput_many(fine_pvs, [0]*len(fine_pvs), wait='all')
+        conf = self.scandb.get_slewpositioner_config(self.inner[0])
         scnf = self.slewscan_config = json.loads(conf.notes)
+        # start connecting to the trajectory motor PVs now, so that they
+        # are connected (and in the get_pv cache) once trajectories are set
+        for pvname in scnf['motors'].values():
+            get_pv(pvname)
         # print("CREATE NEWPORT XPS ", scnf)
         self.xps = NewportXPS(scnf['host'],
                               username=scnf['username'],
@@ -76,44 +97,45 @@ class Slew_Scan(StepScan):
                               extra_triggers=scnf.get('extra_triggers', 0))
         # print("newport done")
         currscan = 'CurrentScan.ini'
-        fileroot = self.scandb.get_info('server_fileroot')
-        userdir = self.scandb.get_info('user_folder')
+        fileroot = infos.get('server_fileroot')
+        userdir = infos.get('user_folder')
         basedir = os.path.join(fileroot, userdir, 'Maps')
         if not os.path.exists(basedir):
             os.mkdir(basedir, mode=509)
             os.chmod(basedir, 509)
 
-        mappref = self.scandb.get_info('epics_map_prefix')
-        if mappref is not None:
-            caput('%sbasedir' % (mappref), userdir)
-            caput('%sstatus'  % (mappref), 'Starting')
+        self.mappref = infos.get('epics_map_prefix')
+        self.map_pvs = {}
+        self.put_mapstatus('basedir', userdir)
+        self.put_mapstatus('status', 'Starting')
         sname = os.path.join(basedir, currscan)
         if not self.filename.endswith('.h5'):
             self.filename = self.filename + '.h5'
 
+        # list the folder once, rather than testing each possible name
+        with os.scandir(basedir) as entries:
+            existing = set(entry.name for entry in entries)
         fname  = fix_filename(self.filename)
-        mapdir = os.path.join(basedir, fname[:-3] + '_rawmap')
         counter = 0
-        while os.path.exists(mapdir) and counter < 9999:
+        while (fname[:-3] + '_rawmap') in existing and counter < 9999:
             fname = increment_filename(fname)
-            mapdir = os.path.join(basedir, fname[:-3] + '_rawmap')
             counter += 1
+        mapdir = os.path.join(basedir, fname[:-3] + '_rawmap')
 
         self.filename = fname
         os.mkdir(mapdir, mode=509)
         os.chmod(mapdir, 509)
 
         hfname= os.path.join(basedir, self.filename)
-        self.set_info('filename', fname)
-        self.set_info('map_folder', mapdir)
+        self.set_infos({'filename': fname, 'map_folder': mapdir})
 
-        fhx  = open(hfname, 'w')
-        fhx.write("%s\n"% mapdir)
-        fhx.close()
-        if mappref is not None:
-            caput('%sfilename' % (mappref), self.filename)
+        with open(hfname, 'w') as fhx:
+            fhx.write("%s\n"% mapdir)
+        self.put_mapstatus('filename', self.filename)
 
         self.mapdir = mapdir
+        self.mapdir_abs = os.path.abspath(mapdir)
+        self.master_file = os.path.join(mapdir, 'Master.dat')
         self.fileroot = fileroot
 
         txt = ['# FastMap configuration file (saved: %s)'%(time.ctime()),
@@ -128,19 +150,13 @@ class Slew_Scan(StepScan):
                     'group = %s' % scnf['group'],
                     'positioners = %s' % posnames])
 
-        txt.append('#------------------#')
-        txt.append('[slow_positioners]')
-        for i, pos in enumerate(self.scandb.get_positioners()):
-            dpv = pos.drivepv
-            if dpv.endswith('.VAL'): dpv = dpv[:-4]
-            txt.append("%i = %s | %s" % (i+1, dpv, pos.name))
+        txt.extend(['#------------------#', '[slow_positioners]'])
+        txt.extend(["%i = %s | %s" % (i+1, pos.drivepv.removesuffix('.VAL'), pos.name)
+                    for i, pos in enumerate(positioners)])
 
-        txt.append('#------------------#')
-        txt.append('[fast_positioners]')
-        for i, pos in enumerate(self.scandb.get_slewpositioners()):
-            dpv = pos.drivepv
-            if dpv.endswith('.VAL'): dpv = dpv[:-4]
-            txt.append("%i = %s | %s" % (i+1, dpv, pos.name))
+        txt.extend(['#------------------#', '[fast_positioners]'])
+        txt.extend(["%i = %s | %s" % (i+1, pos.drivepv.removesuffix('.VAL'), pos.name)
+                    for i, pos in enumerate(self.scandb.get_slewpositioners())])
 
         dim  = 1
         if self.outer is not None:
@@ -152,11 +168,10 @@ class Slew_Scan(StepScan):
         dirpv = pospv + '.DIR'
         if caget(dirpv) == 1:
             start, stop = stop, start
-        step = abs(start-stop)/(npts-1)
+        step = step_size(start, stop, npts)
         self.rowtime = dtime = self.dwelltime*(npts-1)
-        if mappref is not None:
-            caput('%snpts' % (mappref), npts)
-            caput('%snrow' % (mappref), 0)
+        self.put_mapstatus('npts', npts)
+        self.put_mapstatus('nrow', 0)
         axis = None
         for ax, pvname in self.slewscan_config['motors'].items():
             if pvname == pospv:
@@ -186,13 +201,12 @@ class Slew_Scan(StepScan):
             pospv = pvs[0]
             if pospv.endswith('.VAL'):
                 pospv = pospv[:-4]
-            step = abs(start-stop)/(npts-1)
+            step = step_size(start, stop, npts)
             txt.extend(['pos2 = %s'   % pospv,
                         'start2 = %.4f' % start,
                         'stop2 = %.4f' % stop,
                         'step2 = %.4f' % step])
-            if mappref is not None:
-                caput('%smaxrow' % (mappref), npts)
+            self.put_mapstatus('maxrow', npts)
 
         xrd_det = None
         xrf_det = None
@@ -225,13 +239,10 @@ class Slew_Scan(StepScan):
             txt.append('prefix = %s' % xrd_det.prefix)
             txt.append('fileplugin = %s' % xrd_det.filesaver)
 
-        sini = os.path.join(mapdir, 'Scan.ini')
-        f = open(sini, 'w')
-        f.write('\n'.join(txt))
-        f.close()
-        f = open(sname, 'w')
-        f.write('\n'.join(txt))
-        f.close()
+        sini_text = '\n'.join(txt)
+        for inifile in (os.path.join(mapdir, 'Scan.ini'), sname):
+            with open(inifile, 'w') as fh:
+                fh.write(sini_text)
 
         trajs = self.xps.trajectories
         self.motor_vals = {}
@@ -239,8 +250,8 @@ class Slew_Scan(StepScan):
         for i, axes in enumerate(trajs['foreward']['axes']):
             pvname = self.slewscan_config['motors'][axes]
             v1, v2 = trajs['foreward']['start'][i], trajs['backward']['start'][i]
-            thispv = PV(pvname)
-            self.motor_vals[pvname] = (thispv, v1, v2)
+            self.motor_vals[pvname] = (get_pv(pvname), v1, v2)
+        for pvname, (thispv, v1, v2) in self.motor_vals.items():
             self.orig_positions[pvname] = thispv.get()
 
         for p in self.positioners:
@@ -257,32 +268,148 @@ class Slew_Scan(StepScan):
             except AttributeError:
                 pass
 
+        # worker threads for arming and data saving, reused for every row
+        # of the scan, and shut down at the end of run().  The trajectory
+        # has its own worker, so a data save that is stuck cannot delay it.
+        self.io_pool = ThreadPoolExecutor(max_workers=len(self.detectors)+2,
+                                          thread_name_prefix='slew_io')
+        self.traj_pool = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='slew_traj')
+
+
+    def put_mapstatus(self, attr, value):
+        """put value to map status PV (epics_map_prefix + attr), if used"""
+        if self.mappref is None:
+            return
+        if attr not in self.map_pvs:
+            self.map_pvs[attr] = get_pv(self.mappref + attr)
+        self.map_pvs[attr].put(value)
+
+    def put_motors(self, values, wait=False, timeout=60.0):
+        """put values to the (connected, cached) trajectory motor PVs,
+        optionally waiting for all puts to complete"""
+        pvs = [pv for pv, v1, v2 in self.motor_vals.values()]
+        for pv, val in zip(pvs, values):
+            pv.put(val, use_complete=wait)
+        if wait:
+            t0 = time.time()
+            while (not all(pv.put_complete for pv in pvs) and
+                   time.time() < t0 + timeout):
+                poll(0.005, 1.0)
 
     def post_slew_scan(self, **kws):
         for det in self.detectors:
             if isinstance(det, AreaDetector):
                 self.set_info('xrd_1dint_status', 'finishing')
 
+    def start_master_writer(self):
+        """start thread to write master file and slewscan status,
+        so that the row loop does not wait on file or database writes"""
+        self.master_queue = queue.Queue()
+        self.master_thread = Thread(target=self.master_writer,
+                                    name='master_writer', daemon=True)
+        self.master_thread.start()
+
+    def master_writer(self):
+        """write text lines from the master queue, until None is seen.
+        Master.dat is kept open and appended to for the whole scan.
+        (filename, text) items from write_file() are written as whole files.
+        Errors are reported, and the queue is always drained."""
+        try:
+            fh = open(self.master_file, 'w')
+        except OSError as exc:
+            fh = None
+            self.write(f"Cannot open Master file {self.master_file}: {exc}\n")
+        sep = ''
+        while True:
+            textlines = self.master_queue.get()
+            if textlines is None:
+                break
+            if isinstance(textlines, tuple):
+                filename, text = textlines
+                try:
+                    with open(filename, 'w') as ofh:
+                        ofh.write(text)
+                except Exception as exc:
+                    self.write(f"Failed to write {filename}: {exc}\n")
+                continue
+            if fh is not None:
+                try:
+                    fh.write(sep + '\n'.join(textlines))
+                    fh.flush()
+                    sep = '\n'
+                except Exception as exc:
+                    self.write(f"Failed to write Master file: {exc}\n")
+            try:
+                self.scandb.add_slewscanstatus_lines(textlines)
+            except Exception as exc:
+                self.write(f"Failed to write slewscan status: {exc}\n")
+        if fh is not None:
+            fh.close()
+
+    def finish_master_writer(self, timeout=30.0):
+        """wait for all queued master file lines to be written"""
+        self.master_queue.put(None)
+        self.master_thread.join(timeout=timeout)
+
     def write_master(self, textlines):
-        """ write a list of text lines to master file"""
-        for text in textlines:
-            self.scandb.add_slewscanstatus(text)
-
-        self.mastertext.extend(textlines)
-        oldfile = os.path.join(self.mapdir, '_Master_.dat')
-        destfile = os.path.join(self.mapdir, 'Master.dat')
-        if os.path.exists(destfile):
-            shutil.move(destfile, oldfile)
-        fh = open(destfile, 'w')
-        fh.write('\n'.join(self.mastertext))
-        fh.write('')
-        fh.close()
-        os.utime(destfile, None)
-        time.sleep(0.025)
+        """queue a list of text lines to be written to master file"""
+        self.master_queue.put(textlines)
+
+    def write_file(self, filename, text):
+        """queue text to be written to a file by the master writer"""
+        self.master_queue.put((filename, text))
+
+    def finish_xrf_row(self, xrfdet, npulses):
+        """stop XRF detector at the end of a row and wait for its file to be
+        written, returning number of frames captured and whether row is OK
+        """
+        xrfdet.stop()
+        time.sleep(0.02)
+        t0 = time.time()
+        write_complete = xrfdet.file_write_complete()
+        # poll quickly at first, backing off to 0.1 sec
+        ntry, dt = 0, 0.005
+        while not write_complete and (time.time()-t0 < 10.0):
+            time.sleep(dt)
+            dt = min(0.1, 2*dt)
+            write_complete = xrfdet.file_write_complete()
+            ntry = ntry + 1
+        time.sleep(0.01)
+        nxrf = xrfdet.get_numcaptured()
+        # retry (up to twice) finishing capture of incomplete rows
+        for pre_delay, post_delay in ((0.10, 0.10), (0.25, 0)):
+            if nxrf >= npulses-1 and write_complete:
+                break
+            time.sleep(pre_delay)
+            xrfdet.finish_capture()
+            time.sleep(post_delay)
+            nxrf = xrfdet.get_numcaptured()
+            write_complete = xrfdet.file_write_complete()
+        if (nxrf < npulses-2) or not write_complete:
+            self.write("XRF file write failed: write_complete=%s, nxrf=%d, "
+                       "npulses=%d, ntry=%d\n" % (write_complete, nxrf, npulses, ntry))
+            xrfdet.stop()
+            time.sleep(0.1)
+            return nxrf, False
+        return nxrf, True
+
+    def check_future(self, future, label, timeout=0):
+        """wait up to timeout seconds for a worker task, reporting a task
+        that is still running or that raised an exception.
+        Returns False if the task failed"""
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeout:
+            self.write(f"{label} still running after {timeout} sec\n")
+        except Exception as exc:
+            self.write(f"{label} failed: {exc!r}\n")
+            return False
+        return True
 
     def save_mcs_data(self, filename='mcsdata.001', npts=1):
         scafile = self.scadet.get_next_filename()
-        filename = os.path.abspath(os.path.join(self.mapdir, scafile))
+        filename = os.path.join(self.mapdir_abs, scafile)
         _, self.npts_sca = self.scadet.save_arraydata(filename=filename,
                                                    npts=self.npts_sca)
 
@@ -295,14 +422,13 @@ class Slew_Scan(StepScan):
         self.prepare_scan()
         trajs = self.xps.trajectories
 
-        dir_off = 1
-        tname = 'foreward'
-        # if trajs['foreward']['axes'][0] == 'X':
-        #     dir_off += 1
+        # trajectory names for even and odd rows: the first row
+        # (irow=1) runs 'foreward' unless that trajectory starts
+        # above where it stops
+        trajnames = ('backward', 'foreward')
         if trajs['foreward']['start'] >  trajs['foreward']['stop']:
-            dir_off += 1
-        if dir_off % 2 == 0:
-            tname = 'backward'
+            trajnames = ('foreward', 'backward')
+        tname = trajnames[1]
 
         # pvnames = trajs[tname]['axes']
         # print("SlewScan Config ", pvnames, self.slewscan_config['motors'])
@@ -318,10 +444,11 @@ class Slew_Scan(StepScan):
         for p in self.positioners:
             p.move_to_pos(0, wait=False)
 
-        for pv, v1, v2 in self.motor_vals.values():
-            val = v1
-            if tname == 'backward': val = v2
-            pv.put(val, wait=False)
+        # motor start values for each trajectory
+        motor_starts = {'foreward': [v1 for pv, v1, v2 in self.motor_vals.values()],
+                        'backward': [v2 for pv, v1, v2 in self.motor_vals.values()]}
+
+        self.put_motors(motor_starts[tname])
 
         self.pre_scan(npulses=npulses, dwelltime=dwelltime, mode='ndarray')
         self.scandb.clear_slewscanstatus()
@@ -331,7 +458,9 @@ class Slew_Scan(StepScan):
             dim = 2
             l_, pvs, start, stop, _npts = self.outer
             npts = min(_npts, len(self.positioners[0].array))
-            step = abs(start-stop)/(npts-1)
+            step = step_size(start, stop, npts)
+            # formatted outer positions for each row of master file
+            ypos_strs = ["%8.4f" % y for y in self.positioners[0].array[:npts]]
             ypos = str(pvs[0])
             if ypos.endswith('.VAL'):
                 ypos = ypos[:-4]
@@ -347,266 +476,242 @@ class Slew_Scan(StepScan):
         mbuff.extend(['#------------------------------------',
              '# yposition  xrf_file  mcs_file  xps_file  xrd_file   time'])
 
-        self.mastertext = []
-        self.write_master(mbuff)
-
-        def make_filename(fname, i):
-            return "%s.%4.4i" % (fname, i)
-
-        detpath = self.mapdir[len(self.fileroot):]
-        scadet = xrfdet = xrddet = None
-        scafile = xrffile = xrdfile = '_unused_'
-        for det in self.detectors:
-            dlabel = det.label.lower()
-            if dlabel in ('struck', 'usbctr', 'mcs'):
-                scadet = det
-            elif dlabel in ('xspress3', 'multimca')  or 'mca' in dlabel:
-                xrfdet = det
-            elif dlabel.startswith('xrd') or dlabel.startswith('eiger'):
-                xrddet = det
-            det.NDArrayMode(numframes=npulses)
-
-        det_arm_delay = det_start_delay = 0.025
-        for det in self.detectors:
-            det_arm_delay = max(det_arm_delay, det.arm_delay)
-            dx = getattr(det, 'start_delay_arraymode', det.start_delay)
-            det_start_delay = max(det_start_delay, dx)
-
-        self.clear_interrupts()
-        self.set_info('scan_progress', 'starting')
-        self.scandb.set_filename(self.filename)
-        mappref = self.scandb.get_info('epics_map_prefix')
-        rowdata_ok = True
-        start_time = time.time()
-        irow = 0
-        if mappref is not None:
-            caput('%sstatus' % (mappref), 'Collecting')
-        dtimer =  debugtime()
-        self.scandb.set_info('repeated_map_rows', '')
-        repeated_rows = []
-        while irow < npts:
-            if self.look_for_interrupts():
-                if mappref is not None:
-                    caput('%sstatus' % (mappref), 'Aborting')
-                break
-
-            irow += 1
-            dtimer.add('=== row start %i ====' % irow)
-            self.set_info('scan_progress', 'row %i of %i' % (irow, npts))
-            if mappref is not None:
-                caput('%snrow' % (mappref), irow)
-            trajname = ['foreward', 'backward'][(dir_off + irow) % 2]
-
-            if debug:
-                print("# Row %i of %i trajectory='%s'" % (irow, npts, trajname))
-
-            if self.mkernel is not None:
-                now = time.time()
-                prescan_lasttime = float(self.scandb.get_info('prescan_lasttime'))
-                prescan_interval = float(self.scandb.get_info('prescan_interval'))
-                run_prescan = (now > prescan_lasttime + prescan_interval)
-                if run_prescan:
-                    try:
-                        self.mkernel.run("pre_scan_command(row=%i, npts=%i)" % (irow, npts))
-                    except:
-                        print("Failed to run pre_scan_command(row=%i)" % irow)
-                    self.set_info('prescan_lasttime', "%i" % int(now))
-
-            for pv, v1, v2 in self.motor_vals.values():
-                val = v1 if (trajname == 'foreward') else v2
-                pv.put(val, wait=False)
-
-            lastrow_ok = rowdata_ok
-            rowdata_ok = True
+        io_pool = self.io_pool
+        self.start_master_writer()
+        # always flush and close the master file, even if the row loop fails
+        try:
+            self.write_master(mbuff)
 
-            dtimer.add('inner pos move started irow=%i' % irow)
-            # print("ready to arm detectors row ", irow)
+            # detector roles and arm/start delays do not change during the scan
+            scadet = xrfdet = xrddet = None
+            scafile = xrffile = xrdfile = '_unused_'
+            det_arm_delay = det_start_delay = 0.025
             for det in self.detectors:
-                det.arm(mode='ndarray', numframes=npulses, fnum=irow, wait=False)
-
-            # wait for detectors to be armed
-            tout = time.time()+2.0
-            while not all([det.arm_complete for det in self.detectors]):
-                if time.time() > tout:
+                dlabel = det.label.lower()
+                if dlabel in ('struck', 'usbctr', 'mcs'):
+                    scadet = det
+                elif dlabel in ('xspress3', 'multimca')  or 'mca' in dlabel:
+                    xrfdet = det
+                elif dlabel.startswith('xrd') or dlabel.startswith('eiger'):
+                    xrddet = det
+                det.NDArrayMode(numframes=npulses)
+                det_arm_delay = max(det_arm_delay, det.arm_delay)
+                dx = getattr(det, 'start_delay_arraymode', det.start_delay)
+                det_start_delay = max(det_start_delay, dx)
+
+            self.clear_interrupts()
+            self.set_info('scan_progress', 'starting')
+            self.scandb.set_filename(self.filename)
+            rowdata_ok = True
+            start_time = time.time()
+            irow = 0
+            self.put_mapstatus('status', 'Collecting')
+            dtimer =  debugtime(enabled=debug)
+            self.scandb.set_info('repeated_map_rows', '')
+            repeated_rows = []
+            if self.mkernel is not None:
+                prescan = self.scandb.get_infos(('prescan_lasttime', 'prescan_interval'))
+                prescan_lasttime = float(prescan.get('prescan_lasttime') or 0)
+                prescan_interval = float(prescan.get('prescan_interval') or 0)
+            progress_time = 0
+            xrd_calibs = {}
+            while irow < npts:
+                if self.look_for_interrupts(max_age=0.25):
+                    self.put_mapstatus('status', 'Aborting')
                     break
-                time.sleep(0.005)
 
-            dtimer.add('detectors armed %.3f' % det_arm_delay)
-            for det in self.detectors:
-                det.start(arm=False, wait=False)
-
-            time.sleep(det_start_delay)
-            dtimer.add('detectors started  %.3f' % det_start_delay)
-
-            for p in self.positioners:
-                p.move_to_pos(irow-1, wait=True)
-
-            for pv, v1, v2 in self.motor_vals.values():
-                val = v1 if (trajname == 'foreward') else v2
-                pv.put(val, wait=True)
-
-            self.xps.arm_trajectory(trajname, verbose=False)
-            if irow < 2 or not lastrow_ok:
-                time.sleep(0.10)
-            dtimer.add('XPS trajectory armed')
-
-            dtimer.add('positioner moves done')
-            # start trajectory in another thread
-            scan_thread = Thread(target=self.xps.run_trajectory,
-                                 kwargs=dict(save=False, verbose=False),
-                                 name='trajectory_thread')
-            scan_thread.start()
-
-            dtimer.add('scan thread started')
-            posfile = "xps.%4.4i" % (irow)
-            if scadet is not None:
-                scafile = scadet.get_next_filename()
-            if xrfdet is not None:
-                xrffile = xrfdet.get_next_filename()
-            if xrddet is not None:
-                xrdfile = xrddet.get_next_filename()
-
-            if irow < 2:
-                self.save_envdata(filename=env_file)
+                irow += 1
+                dtimer.add('=== row start %i ====' % irow)
+                # the map nrow PV shows every row: limit scan_progress
+                # database writes to about one per second
+                if irow in (1, npts) or time.time() > progress_time + 1.0:
+                    progress_time = time.time()
+                    self.set_info('scan_progress', 'row %i of %i' % (irow, npts))
+                self.put_mapstatus('nrow', irow)
+                trajname = trajnames[irow % 2]
+
+                if debug:
+                    print("# Row %i of %i trajectory='%s'" % (irow, npts, trajname))
+
+                if self.mkernel is not None:
+                    now = time.time()
+                    run_prescan = (now > prescan_lasttime + prescan_interval)
+                    if run_prescan:
+                        try:
+                            self.mkernel.run("pre_scan_command(row=%i, npts=%i)" % (irow, npts))
+                        except:
+                            print("Failed to run pre_scan_command(row=%i)" % irow)
+                        prescan_lasttime = int(now)
+                        self.set_info('prescan_lasttime', "%i" % prescan_lasttime)
+
+                self.put_motors(motor_starts[trajname])
+
+                lastrow_ok = rowdata_ok
+                rowdata_ok = True
+
+                dtimer.add('inner pos move started irow=%i' % irow)
+                # print("ready to arm detectors row ", irow)
+                # arm detectors concurrently, re-raising any arming errors
+                arm_futures = [io_pool.submit(det.arm, mode='ndarray', numframes=npulses,
+                                              fnum=irow, wait=False)
+                               for det in self.detectors]
+                wait(arm_futures, timeout=5.0)
+                for fut in arm_futures:
+                    if fut.done():
+                        fut.result()
+                if not self.wait_for_arm(timeout=2.0):
+                    self.write('#Row %d: detectors not armed after 2 sec\n' % irow)
+
+                dtimer.add('detectors armed %.3f' % det_arm_delay)
+                for det in self.detectors:
+                    det.start(arm=False, wait=False)
+
+                # detectors need det_start_delay before the trajectory starts:
+                # overlap this with the positioner moves, not a fixed sleep
+                ready_time = time.time() + det_start_delay
+                dtimer.add('detectors started  %.3f' % det_start_delay)
+
+                for p in self.positioners:
+                    p.move_to_pos(irow-1, wait=True)
+
+                self.put_motors(motor_starts[trajname], wait=True)
+
+                self.xps.arm_trajectory(trajname, verbose=False)
+                if irow < 2 or not lastrow_ok:
+                    ready_time = max(ready_time, time.time() + 0.10)
+                dtimer.add('XPS trajectory armed')
+
+                dtimer.add('positioner moves done')
+                if ready_time > time.time():
+                    time.sleep(ready_time - time.time())
+                # start trajectory in another thread
+                scan_thread = self.traj_pool.submit(self.xps.run_trajectory,
+                                                    save=False, verbose=False)
+
+                dtimer.add('scan thread started')
+                posfile = "xps.%4.4i" % (irow)
+                if scadet is not None:
+                    scafile = scadet.get_next_filename()
                 if xrfdet is not None:
-                    xrfdet.save_calibration(roi_file)
+                    xrffile = xrfdet.get_next_filename()
                 if xrddet is not None:
-                    xrd_poni = self.scandb.get_info('xrd_calibration')
-                    calib = json.loads(self.scandb.get_detectorconfig(xrd_poni).text)
-                    write_poni(poni_file, calname=xrd_poni, **calib)
-
-            if dim == 2:
-                pos0 = "%8.4f" % self.positioners[0].array[irow-1]
-            else:
-                pos0 = "_unused_"
-
-            masterline = "%s %s %s %s %s" % (pos0, xrffile, scafile,
-                                             posfile, xrdfile)
-            if xrddet is not None:
+                    xrdfile = xrddet.get_next_filename()
+
+                if irow < 2:
+                    # PV values are read now, the file is written by the master writer
+                    self.write_file(env_file, self.get_envdata())
+                    if xrfdet is not None:
+                        xrfdet.save_calibration(roi_file)
+                    if xrddet is not None:
+                        xrd_poni = self.scandb.get_info('xrd_calibration')
+                        if xrd_poni not in xrd_calibs:
+                            dconf = self.scandb.get_detectorconfig(xrd_poni)
+                            xrd_calibs[xrd_poni] = json.loads(dconf.text)
+                        write_poni(poni_file, calname=xrd_poni, **xrd_calibs[xrd_poni])
+
+                pos0 = ypos_strs[irow-1] if dim == 2 else '_unused_'
+
+                # wait for trajectory to finish, returning as soon as it is done
+                dtimer.add('scan thread run join()')
                 xt0 = time.time()
-
-            # wait for trajectory to finish
-            dtimer.add('scan thread run join()')
-            xt0 = time.time()
-            while scan_thread.is_alive():
-                time.sleep(0.1)
-                if time.time()-xt0 > 0.8*self.rowtime:
-                    break
-                if self.look_for_interrupts():
+                while not scan_thread.done():
+                    wait([scan_thread], timeout=0.25)
+                    if scan_thread.done() or time.time()-xt0 > 0.8*self.rowtime:
+                        break
+                    if self.look_for_interrupts():
+                        break
+
+                self.check_future(scan_thread, 'XPS trajectory',
+                                  timeout=self.rowtime/2.0)
+                dtimer.add('scan thread joined')
+                if self.look_for_interrupts(max_age=0.25):
+                    self.put_mapstatus('status', 'Aborting')
                     break
 
-            scan_thread.join(timeout=self.rowtime/2.0)
-            dtimer.add('scan thread joined')
-            if self.look_for_interrupts():
-                if mappref is not None:
-                    caput('%sstatus' % (mappref), 'Aborting')
-                break
+                self.write_master(["%s %s %s %s %s %8.4f" % (pos0, xrffile, scafile, posfile,
+                                                             xrdfile, time.time()-start_time)])
 
-            self.write_master(["%s %8.4f" % (masterline, time.time()-start_time)])
+                if irow < npts-1:
+                    for p in self.positioners:
+                        p.move_to_pos(irow, wait=False)
+
+                dtimer.add('started next move, reading')
+
+                pos_file = os.path.join(self.mapdir_abs, posfile)
+                pos_saver_thread = io_pool.submit(self.xps.read_and_save, pos_file)
+                dtimer.add('started XPS save')
+
+                self.npts_sca = npulses
+                mcs_saver_thread = None
+                if scadet is not None:
+                    scadet.stop()
+                    self.scadet = scadet
+                    mcs_saver_thread = io_pool.submit(self.save_mcs_data)
+                dtimer.add('started MCS data save')
 
-            if irow < npts-1:
-                for p in self.positioners:
-                    p.move_to_pos(irow, wait=False)
-
-            dtimer.add('started next move, reading')
-
-            pos_file = os.path.abspath(os.path.join(self.mapdir, posfile))
-            pos_saver_thread = Thread(target=self.xps.read_and_save,
-                                  args=(pos_file,), name='pos_saver')
-            pos_saver_thread.start()
-            dtimer.add('started XPS save')
-
-            self.npts_sca = npulses
-            if scadet is not None:
-                scadet.stop()
-                self.scadet = scadet
-                mcs_saver_thread = Thread(target=self.save_mcs_data,  name='mcs_saver')
-                mcs_saver_thread.start()
-            dtimer.add('started MCS data save')
-
-            time.sleep(0.02)
-            nxrf = nxrd = 0
-            if xrfdet is not None:
-                xrfdet.stop()
                 time.sleep(0.02)
+                nxrf = nxrd = 0
                 t0 = time.time()
-                write_complete = xrfdet.file_write_complete()
-                ntry = 0
-                while not write_complete and (time.time()-t0 < 10.0):
-                    write_complete = xrfdet.file_write_complete()
-                    ntry = ntry + 1
-                    time.sleep(0.01*ntry)
-                time.sleep(0.01)
-                nxrf = xrfdet.get_numcaptured()
-                if (nxrf < npulses-1) or not write_complete:
-                    time.sleep(0.10)
-                    xrfdet.finish_capture()
-                    time.sleep(0.10)
-                    nxrf = xrfdet.get_numcaptured()
-                    write_complete = xrfdet.file_write_complete()
-                if (nxrf < npulses-1) or not write_complete:
-                    time.sleep(0.250)
-                    xrfdet.finish_capture()
-                    nxrf = xrfdet.get_numcaptured()
-                    write_complete = xrfdet.file_write_complete()
-                if (nxrf < npulses-2) or not write_complete:
-                    print("XRF file write failed ", write_complete, nxrf, npulses, ntry)
-                    rowdata_ok = False
-                    xrfdet.stop()
-                    time.sleep(0.1)
-            dtimer.add('saved XRF data')
-
-            if xrddet is not None:
-                nxrd = xrddet.get_numcaptured()
-                while ((nxrd < nxrf) and
-                       (time.time()- t0 < 10.0)):
-                    nxrd = xrddet.get_numcaptured()
-                    time.sleep(0.003)
-                xrddet.stop()
-                dtimer.add('saved XRD data')
-
-            mcs_saver_thread.join(timeout=2)
-            pos_saver_thread.join(timeout=5)
-            if pos_saver_thread.is_alive():
-                print('ERROR:  NewportXPS gathering thread is still alive')
-            dtimer.add('saved XPS data')
-
-            rowdata_ok = (rowdata_ok and
-                          (self.npts_sca >= npulses-2) and
-                          (self.xps.ngathered >= npulses-2) and
-                          (nxrf >= npulses-2) and
-                          (not pos_saver_thread.is_alive()))
-
-            if debug or True:
-                print("#== Row %d nXPS=%d, nMCS=%d, nXRF=%d, nXRD=%d  npulses=%d, OK=%s" %
-                      (irow, self.xps.ngathered, self.npts_sca, nxrf, nxrd, npulses, repr(rowdata_ok)))
-            if not rowdata_ok:
-                fmt=  '#BAD Row %d nXPS=%d, nMCS=%d, nXRF=%d, nXRD=%d: (npulses=%d) redo!\n'
-                self.write(fmt % (irow, self.xps.ngathered, self.npts_sca, nxrf, nxrd, npulses))
-                irow -= 1
-                [p.move_to_pos(irow, wait=False) for p in self.positioners]
-                time.sleep(0.25)
-
-            elif irow < npts-1:
-                for p in self.positioners:
-                    p.move_to_pos(irow, wait=True)
+                if xrfdet is not None:
+                    # XPS and MCS data are being saved in the worker pool
+                    nxrf, xrf_ok = self.finish_xrf_row(xrfdet, npulses)
+                    rowdata_ok = rowdata_ok and xrf_ok
+                dtimer.add('saved XRF data')
 
-            # check again for pause, resume, and abort
-            self.look_for_interrupts()
-            while self.pause:
-                time.sleep(0.25)
-                if self.look_for_interrupts():
+                if xrddet is not None:
+                    nxrd = xrddet.get_numcaptured()
+                    while ((nxrd < nxrf) and
+                           (time.time()- t0 < 10.0)):
+                        nxrd = xrddet.get_numcaptured()
+                        time.sleep(0.003)
+                    xrddet.stop()
+                    dtimer.add('saved XRD data')
+
+                mcs_ok = True
+                if mcs_saver_thread is not None:
+                    mcs_ok = self.check_future(mcs_saver_thread, 'MCS data save',
+                                               timeout=2)
+                pos_ok = self.check_future(pos_saver_thread, 'XPS position save',
+                                           timeout=5)
+                dtimer.add('saved XPS data')
+
+                rowdata_ok = (rowdata_ok and
+                              (self.npts_sca >= npulses-2) and
+                              (self.xps.ngathered >= npulses-2) and
+                              (nxrf >= npulses-2) and
+                              pos_saver_thread.done() and pos_ok and mcs_ok)
+
+                if debug or True:
+                    print("#== Row %d nXPS=%d, nMCS=%d, nXRF=%d, nXRD=%d  npulses=%d, OK=%s" %
+                          (irow, self.xps.ngathered, self.npts_sca, nxrf, nxrd, npulses, repr(rowdata_ok)))
+                if not rowdata_ok:
+                    fmt=  '#BAD Row %d nXPS=%d, nMCS=%d, nXRF=%d, nXRD=%d: (npulses=%d) redo!\n'
+                    self.write(fmt % (irow, self.xps.ngathered, self.npts_sca, nxrf, nxrd, npulses))
+                    irow -= 1
+                    [p.move_to_pos(irow, wait=False) for p in self.positioners]
+                    time.sleep(0.25)
+
+                elif irow < npts-1:
+                    for p in self.positioners:
+                        p.move_to_pos(irow, wait=True)
+
+                # check again for pause, resume, and abort
+                self.look_for_interrupts()
+                while self.pause and not self.abort:
+                    time.sleep(0.25)
+                    self.look_for_interrupts()
+                if self.abort:
+                    self.put_mapstatus('status', 'Aborting')
                     break
-            if self.look_for_interrupts():
-                if mappref is not None:
-                    caput('%sstatus' % (mappref), 'Aborting')
-                break
-            if debug:
-                dtimer.show()
-            time.sleep(0.01)
+                if debug:
+                    dtimer.show()
+                time.sleep(0.01)
+        finally:
+            io_pool.shutdown(wait=False)
+            self.traj_pool.shutdown(wait=False)
+            self.finish_master_writer()
 
-        if mappref is not None:
-            caput('%sstatus' % (mappref), 'Finishing')
+        self.put_mapstatus('status', 'Finishing')
 
         self.post_scan()
         self.set_info('scan_progress', 'done')
@@ -615,11 +720,13 @@ class Slew_Scan(StepScan):
     def check_beam_ok(self):
         return True
 
-    def save_envdata(self,filename='Environ.dat'):
-        buff = []
-        for desc, pvname, value in self.read_extra_pvs():
-            buff.append("; %s (%s) = %s" % (desc, pvname, value))
+    def get_envdata(self):
+        """return text of current extra PV values, for Environ.dat"""
+        buff = ["; %s (%s) = %s" % (desc, pvname, value)
+                for desc, pvname, value in self.read_extra_pvs()]
         buff.append("")
+        return '\n'.join(buff)
+
+    def save_envdata(self,filename='Environ.dat'):
         with open(filename,'w') as fh:
-            fh.write('\n'.join(buff))
-        fh.close()
+            fh.write(self.get_envdata())
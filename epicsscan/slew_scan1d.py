@@ -8,19 +8,21 @@ import json
 import shutil
 import time
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
 
 from .scan import StepScan
 from .positioner import Positioner
 from .saveable import Saveable
 
-from .utils import ScanDBAbort
+from .utils import ScanDBAbort, step_size
+from .simpledb import cast_info
 from .detectors import Struck, TetrAMM, Xspress3
 from .detectors import (Counter, Trigger, AreaDetector, write_poni)
 from .file_utils import fix_varname, fix_filename, increment_filename
 from .detectors.counter import ROISumCounter, EVAL4PLOT
 
-from epics import PV, poll, get_pv, caget, caput
+from epics import poll, get_pv, caget
 from newportxps import NewportXPS
 
 from .debugtime import debugtime
@@ -47,8 +49,7 @@ class Slew_Scan1D(StepScan):
         # ZeroFineMotors before map? not available
         self.scandb.set_info('qxafs_config', 'slew')
         self.scandb.set_info('qxafs_running', 0) # abort
-        inner_pos = self.scandb.get_slewpositioner(self.inner[0])
-        conf = self.scandb.get_config_id(inner_pos.config_id)
+        conf = self.scandb.get_slewpositioner_config(self.inner[0])
 
         scnf = self.slewscan_config = json.loads(conf.notes)
         self.xps = NewportXPS(scnf['host'],
@@ -66,7 +67,7 @@ class Slew_Scan1D(StepScan):
         dirpv = pospv + '.DIR'
         if caget(dirpv) == 1:
             start, stop = stop, start
-        step = abs(start-stop)/(npts-1)
+        step = step_size(start, stop, npts)
         self.rowtime = dtime = self.dwelltime*(npts-1)
 
         axis = None
@@ -100,7 +101,7 @@ class Slew_Scan1D(StepScan):
         for i, axes in enumerate(trajs['foreward']['axes']):
             pvname = self.slewscan_config['motors'][axes]
             v1, v2 = trajs['foreward']['start'][i], trajs['backward']['start'][i]
-            thispv = PV(pvname)
+            thispv = get_pv(pvname)
             self.motor_vals[pvname] = (thispv, v1, v2)
             self.orig_positions[pvname] = thispv.get()
 
@@ -116,8 +117,9 @@ class Slew_Scan1D(StepScan):
 
     def post_scan(self):
         self.set_info('scan_progress', 'finishing')
+        # restore positions through the cached, connected PVs, not waiting
         for pvname, val in self.orig_positions.items():
-            caput(pvname, val)
+            get_pv(pvname).put(val)
 
         for m in self.post_scan_methods:
             m()
@@ -134,7 +136,10 @@ class Slew_Scan1D(StepScan):
         run a 1D slew scan
         """
         dtimer =  debugtime()
-        debug = self.scandb.get_info('debug_scan', as_bool=True) or debug
+        # settings used during this scan, read in one query
+        infos = self.scandb.get_infos(('debug_scan', 'server_fileroot',
+                                       'user_folder'))
+        debug = cast_info(infos.get('debug_scan'), as_bool=True) or debug
         self.prepare_scan()
 
         trajs = self.xps.trajectories
@@ -174,37 +179,36 @@ class Slew_Scan1D(StepScan):
         estimated_scantime = npts*dtime
         dtimer.add('set dwelltime')
         self.set_info('scan_progress', 'preparing scan')
-        extra_vals = []
-        for desc, pv in self.extra_pvs:
-            extra_vals.append((desc, pv.get(as_string=True), pv.pvname))
 
         # get folder name for full data from detectors
-        fileroot = self.scandb.get_info('server_fileroot')
-        userdir  = self.scandb.get_info('user_folder')
+        fileroot = infos.get('server_fileroot')
+        userdir  = infos.get('user_folder')
         xrfdir   = os.path.join(userdir, 'XAFSXRF')
         xrfdir_server = os.path.join(fileroot, xrfdir)
-        if not os.path.exists(xrfdir_server):
-            os.mkdir(xrfdir_server, mode=509)
+        os.makedirs(xrfdir_server, mode=509, exist_ok=True)
 
         det_arm_delay = 0.1
         det_start_delay = 0.5
-        det_prefixes = []
-        for det in reversed(self.detectors):
-            det_prefixes.append(det.prefix)
-            det.arm(mode='roi', numframes=npulses, fnum=0, wait=False)
+        for det in self.detectors:
             # det.config_filesaver(path=xrfdir)
             det_arm_delay = max(det_arm_delay, det.arm_delay)
             det_start_delay = max(det_start_delay, det.start_delay)
+        # arm detectors concurrently, re-raising any arming errors
+        with ThreadPoolExecutor(max_workers=max(1, len(self.detectors)),
+                                thread_name_prefix='slew_arm') as arm_pool:
+            arm_futures = [arm_pool.submit(det.arm, mode='roi', numframes=npulses,
+                                           fnum=0, wait=False)
+                           for det in reversed(self.detectors)]
+            wait(arm_futures)
+        for fut in arm_futures:
+            fut.result()
         time.sleep(det_arm_delay)
 
         self.scandb.set_info('qxafs_config', 'slew')
         self.scandb.set_info('qxafs_running', 2) # running
         # wait for detectors to be armed
-        tout = time.time()+5.0
-        while not all([det.arm_complete for det in self.detectors]):
-            if time.time() > tout:
-                break
-            time.sleep(0.01)
+        if not self.wait_for_arm(timeout=5.0):
+            self.write('Warning: detectors not armed after 5 sec\n')
 
         dtimer.add('detectors armed %.4f / %.4f' % (det_arm_delay, det_start_delay))
         self.init_scandata()
@@ -271,54 +275,57 @@ class Slew_Scan1D(StepScan):
         npulses, gather_text = self.xps.read_gathering()
         xvals = self.gathering2xvals(gather_text)
 
-        self.pos_actual = []
-        for x in xvals:
-           self.pos_actual.append([x])
+        # datafile appends counter values to each row: keep rows as lists
+        self.pos_actual = [[x] for x in xvals.tolist()]
         nx = len(xvals)
         #
-        [c.read() for c in self.counters]
-        ndat = [len(c.buff[1:]) for c in self.counters]
-        narr = min(ndat)
+        # read all counters, re-reading only those without a full row yet
+        # polling quickly at first, backing off to 0.05 sec
+        waiting = self.counters
         t0  = time.monotonic()
-        while narr < (nx-1) and (time.monotonic()-t0) < 5.0:
-            time.sleep(0.05)
-            [c.read() for c in self.counters]
-            ndat = [len(c.buff[1:]) for c in self.counters]
-            narr = min(ndat)
-
-        mca_offsets = {}
-        counter_buffers = []
-        for c in self.counters:
-            label = c.label.lower()
-            if 'mca' in label and 'clock' in label:
-                buff = np.array(c.read())
-                offset = 1
-                if buff[0] == 0 and buff[1] > 1.10*(buff[2:-1].mean()):
-                    offset = 2
-                key = label.replace('clock', '').strip()
-                mca_offsets[key] = offset
+        delay = 0.002
+        while True:
+            for c in waiting:
+                c.read()
+            waiting = [c for c in waiting if len(c.buff) < nx]
+            if len(waiting) == 0 or (time.monotonic()-t0) > 5.0:
+                break
+            time.sleep(delay)
+            delay = min(0.05, 1.5*delay)
 
-        dtimer.add('read all counters (done)')
-        # remove hot first pixel AND align to proper x values
-        data4calcs = {}
+        # convert buffers to arrays, find each counter's MCA, and
+        # the first-pixel offsets from the MCA clock counters
+        mca_offsets, mca_keys = {}, []
         for c in self.counters:
-            offset = 1
+            c.buff = np.asarray(c.buff)
             label = c.label.lower()
+            key = None
             if 'mca' in label:
-                words = label.split()
                 key = ' '
-                for word in words:
+                for word in label.split():
                     if word.startswith('mca'):
                         key = word
-                offset = mca_offsets.get(key, 1)
-            c.buff = c.buff[offset:]
-            c.buff = c.buff[:nx]
-            # print("-> ", c.label, offset, len(c.buff), c.buff[:3], c.buff[-2:])
+                if 'clock' in label:
+                    # as read() returns, use the net buffer when there is one
+                    buff = np.asarray(getattr(c, 'net_buff', c.buff))
+                    offset = 1
+                    if buff[0] == 0 and buff[1] > 1.10*(buff[2:-1].mean()):
+                        offset = 2
+                    mca_offsets[label.replace('clock', '').strip()] = offset
+            mca_keys.append(key)
 
-            data4calcs[c.pvname] = np.array(c.buff)
+        dtimer.add('read all counters (done)')
+        # remove hot first pixel AND align to proper x values
+        for c, key in zip(self.counters, mca_keys):
+            offset = 1 if key is None else mca_offsets.get(key, 1)
+            c.buff = c.buff[offset:offset+nx]
+            # print("-> ", c.label, offset, len(c.buff), c.buff[:3], c.buff[-2:])
 
-        for c in self.counters:
-            if c.pvname.startswith(EVAL4PLOT):
+        eval_counters = [c for c in self.counters if c.pvname.startswith(EVAL4PLOT)]
+        if len(eval_counters) > 0:
+            # calculated counters may alter their input arrays: give them copies
+            data4calcs = {c.pvname: c.buff.copy() for c in self.counters}
+            for c in eval_counters:
                 _counter = eval(c.pvname[len(EVAL4PLOT):])
                 _counter.data = data4calcs
                 c.buff = _counter.read()
@@ -351,14 +358,9 @@ class Slew_Scan1D(StepScan):
         energy and height. Gathering data is text with columns of
          Theta_Current, Theta_Set, Height_Current, Height_Set
         """
-        xvals = []
-        for line in text.split('\n'):
-            line = line[:-1].strip()
-            if len(line) > 4:
-                words = line[:-1].split()
-                xvals.append(float(words[0]))
-
-        xvals = np.array(xvals)
+        # take first word of each data line, and let numpy convert to float
+        xvals = np.array([line.split(None, 1)[0] for line in text.split('\n')
+                          if len(line[:-1].strip()) > 4], dtype=np.float64)
         return (xvals[1:] + xvals[:-1])/2.0
 
 
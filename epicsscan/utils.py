@@ -1,4 +1,5 @@
 import sys
+import re
 import socket
 import time
 import json
@@ -23,6 +24,12 @@ def hms(secs):
     "format time in seconds to H:M:S"
     return str(timedelta(seconds=int(secs)))
 
+def step_size(start, stop, npts):
+    "step between npts evenly spaced points from start to stop (0 if npts < 2)"
+    if npts < 2:
+        return 0.0
+    return abs(stop-start)/(npts-1)
+
 def strip_quotes(t):
     d3, s3, d1, s1 = '"""', "'''", '"', "'"
     if hasattr(t, 'startswith'):
@@ -34,13 +41,18 @@ def strip_quotes(t):
             t = t[1:-1]
     return t
 
+NON_ASCII = re.compile('[^\x00-\x7f]')
+
 def plain_ascii(s, replace=''):
     """
     replace non-ASCII characters with blank or other string
     very restrictive (basically ord(c) < 128 only)
     """
-    if s is None: s = ''
-    return "".join([i for i in s if ord(i)<128])
+    if s is None:
+        return ''
+    if replace == '':
+        return s.encode('ascii', 'ignore').decode('ascii')
+    return NON_ASCII.sub(lambda m: replace, s)
 
 def get_units(pv, default):
     try:
@@ -57,15 +69,10 @@ def normalize_pvname(name):
     return name if  '.' in name else f"{name}.VAL"
 
 def json2ascii(inp):
-    """convert input unicode json text to pure ASCII/utf-8"""
-    if isinstance(inp, dict):
-        return dict([(json2ascii(k), json2ascii(v)) for k, v in inp.iteritems()])
-    elif isinstance(inp, list):
-        return [json2ascii(k) for k in inp]
-    elif isinstance(inp, unicode):
-        return inp.encode('utf-8')
-    else:
-        return inp
+    """return input json data unchanged: with Python 3, json.loads
+    already gives str keys and strings, so no conversion is needed.
+    kept for backward compatibility"""
+    return inp
 
 
 PARENS = {'{': '}', '(': ')', '[': ']'}
@@ -76,17 +83,20 @@ BSLASH = '\\'
 COMMENT = '#'
 DBSLASH = '\\\\'
 
+# characters that is_complete() needs to look at: all others are skipped
+TOKENS = re.compile('[%s]' % re.escape(QUOTES + OPENS + CLOSES + COMMENT))
+
 def find_eostring(txt, eos, istart):
     """find end of string token for a string"""
     while True:
-        inext = txt[istart:].find(eos)
+        inext = txt.find(eos, istart)
         if inext < 0:  # reached end of text before match found
             return eos, len(txt)
-        elif (txt[istart+inext-1] == BSLASH and
-              txt[istart+inext-2] != BSLASH):  # matched quote was escaped
-            istart = istart+inext+len(eos)
+        elif (txt[inext-1] == BSLASH and
+              txt[inext-2] != BSLASH):  # matched quote was escaped
+            istart = inext+len(eos)
         else: # real match found! skip ahead in string
-            return '', istart+inext+len(eos)-1
+            return '', inext+len(eos)-1
 
 
 def is_complete(text):
@@ -95,9 +105,13 @@ def is_complete(text):
     for strings quotes and open / close delimiters,
     including nested delimeters.
     """
-    itok, istart, eos = 0, 0, ''
+    itok, eos = 0, ''
     delims = []
-    while itok < len(text):
+    while True:
+        match = TOKENS.search(text, itok)
+        if match is None:
+            break
+        itok = match.start()
         c = text[itok]
         if c in QUOTES:
             eos = c
@@ -111,10 +125,8 @@ def is_complete(text):
         elif c in CLOSES and len(delims) > 0 and c == delims[-1]:
             delims.pop()
         elif c == COMMENT and eos == '': # comment char outside string
-            jtok = itok
-            if '\n' in text[itok:]:
-                itok = itok + text[itok:].index('\n')
-            else:
+            itok = text.find('\n', itok)
+            if itok < 0:
                 itok = len(text)
         itok += 1
     return eos=='' and len(delims)==0 and not text.rstrip().endswith(BSLASH)
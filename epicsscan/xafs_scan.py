@@ -10,6 +10,7 @@ import json
 import numpy as np
 from multiprocessing import Process
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 from epics import caget, caput, PV, get_pv
 from epics.ca import CASeverityException
 from newportxps import NewportXPS
@@ -110,30 +111,33 @@ class XAFS_Scan(StepScan):
         if step is not None:
             npts = 1 + int(0.1  + abs(stop - start)/step)
 
-        en_arr = list(np.linspace(start, stop, npts))
+        en_arr = np.linspace(start, stop, npts)
         self.regions.append((start, stop, npts, relative, e0, use_k, dtime,
                              dtime_final, dtime_wt))
 
         if use_k:
-            en_arr = [e0 + ktoe(v) for v in en_arr]
+            en_arr = e0 + ktoe(en_arr)
         elif relative:
-            en_arr = [e0 +    v    for v in en_arr]
+            en_arr = e0 + en_arr
 
         # check that all energy values in this region are
-        # greater than previously defined regions
-        en_arr.sort()
+        # greater than previously defined regions.  Energies are
+        # only ever appended in increasing order, so the last one
+        # is the largest.
+        en_arr = np.sort(en_arr)
         min_energy = min_estep
         if len(self.energies) > 0:
-            min_energy += max(self.energies)
-        en_arr = [e for e in en_arr if e > min_energy]
+            min_energy += self.energies[-1]
+        ifirst = np.searchsorted(en_arr, min_energy, side='right')
+        en_arr = en_arr[ifirst:].tolist()
 
         npts   = len(en_arr)
 
         dt_arr = [dtime]*npts
         # allow changing counting time linear or by a power law.
-        if dtime_final is not None and dtime_wt > 0:
+        if dtime_final is not None and dtime_wt > 0 and npts > 1:
             _vtime = (dtime_final-dtime)*(1.0/(npts-1))**dtime_wt
-            dt_arr= [dtime + _vtime *i**dtime_wt for i in range(npts)]
+            dt_arr = (dtime + _vtime*np.arange(npts)**dtime_wt).tolist()
         self.energies.extend(en_arr)
         self.dwelltime.extend(dt_arr)
         if self.energy_pos is not None:
@@ -187,6 +191,14 @@ class QXAFS_Scan(XAFS_Scan):
 
         caput(qconf['y2_track_pv'], 1)
         self.scandb.set_info('qxafs_running', 0)
+
+        # keep monitored PVs for values read for every trajectory
+        conf['theta_motor'] = conf['motors']['THETA']
+        conf['width_motor'] = conf['motors']['HEIGHT']
+        self.mono_pvs = {'dspace': get_pv(conf['dspace_pv']),
+                         'height': get_pv(conf['height_pv']),
+                         'theta_off': get_pv(conf['theta_motor'] + '.OFF'),
+                         'width_off': get_pv(conf['width_motor'] + '.OFF')}
         if self.with_id:
             caput(qconf['id_array_pv'], np.zeros(2000))
 
@@ -198,25 +210,20 @@ class QXAFS_Scan(XAFS_Scan):
         if self.config is None:
             self.connect_qxafs()
 
-        qconf = self.config
-        qconf['theta_motor'] = qconf['motors']['THETA']
-        qconf['width_motor'] = qconf['motors']['HEIGHT']
-
-        dspace = caget(qconf['dspace_pv'])
-        height = caget(qconf['height_pv'])
-        th_off = caget(qconf['theta_motor'] + '.OFF')
-        wd_off = caget(qconf['width_motor'] + '.OFF')
+        dspace = self.mono_pvs['dspace'].get()
+        height = self.mono_pvs['height'].get()
+        th_off = self.mono_pvs['theta_off'].get()
+        wd_off = self.mono_pvs['width_off'].get()
         # theta_accel = min(1.5, theta_accel)
 
         # we want energy trajectory points to be at or near
         # midpoints of desired energy values
-        estep = self.energies[1]-self.energies[0]
+        energies = np.asarray(self.energies)
+        estep = energies[1]-energies[0]
 
-        # enx = [self.energies[0]-2*estep, self.energies[0]-estep]
-        enx = [self.energies[0]-estep]
-        enx.extend(list(self.energies))
-        enx.append(2*self.energies[-1]  - self.energies[-2])
-        enx = np.array(enx)
+        # enx = [energies[0]-2*estep, energies[0]-estep]
+        enx = np.concatenate(([energies[0]-estep], energies,
+                              [2*energies[-1] - energies[-2]]))
         energy = (enx[1:] + enx[:-1])/2.0
 
         # but now update self.energies to better reflect what will
@@ -229,16 +236,22 @@ class QXAFS_Scan(XAFS_Scan):
             energy = energy[::-1]
             times  = times[::-1]
 
+        # smooth theta, and compute width, velocities with in-place operations
         traw    = energy2angle(energy, dspace=dspace)
-        theta  = 1.0*traw
-        theta[1:-1] = traw[1:-1]/2.0 + traw[:-2]/4.0 + traw[2:]/4.0
-        width  = height / (2.0 * np.cos(theta/RAD2DEG))
+        theta  = 0.5*traw
+        theta[1:-1] += 0.25*(traw[:-2] + traw[2:])
+        theta[0], theta[-1] = traw[0], traw[-1]
+        width  = np.cos(theta/RAD2DEG)
+        width *= 2.0
+        np.divide(height, width, out=width)
 
         width -= wd_off
         theta -= th_off
 
-        tvelo = np.gradient(theta)/times
-        wvelo = np.gradient(width)/times
+        tvelo = np.gradient(theta)
+        tvelo /= times
+        wvelo = np.gradient(width)
+        wvelo /= times
         tim0  = abs(tvelo[0] / theta_accel)
         the0  = 0.5 * tvelo[ 0] * tim0
         wid0  = 0.5 * wvelo[ 0] * tim0
@@ -248,19 +261,17 @@ class QXAFS_Scan(XAFS_Scan):
         dtheta = np.diff(theta)
         dwidth = np.diff(width)
         dtime  = times[1:]
-        fmt = '%.8f, %.8f, %.8f, %.8f, %.8f'
-        efirst = fmt % (tim0, the0, tvelo[0], wid0, wvelo[0])
-        elast  = fmt % (tim0, the1, 0.00,     wid1, 0.00)
+        fmt = '%.8f, %.8f, %.8f, %.8f, %.8f\n'
 
-        buff  = ['', efirst]
         npts = len(dtheta)
-        for i in range(npts):
-            buff.append(fmt % (dtime[i], dtheta[i], tvelo[i],
-                               dwidth[i], wvelo[i]))
-        buff.append(elast)
-
-        buff.append("")
-        buff = '\n'.join(buff)
+        segments = np.column_stack((dtime, dtheta, tvelo[:npts],
+                                    dwidth, wvelo[:npts]))
+        # format the whole trajectory text, including the first
+        # (accelerate) and last (decelerate) lines, in a single operation
+        values = [tim0, the0, tvelo[0], wid0, wvelo[0]]
+        values.extend(segments.ravel().tolist())
+        values.extend([tim0, the1, 0.00, wid1, 0.00])
+        buff = ('\n' + fmt*(npts+2)) % tuple(values)
         traj = {'energy': energy, 'buff': buff,
                 'width': width, 'theta': theta, 'theta0': the0,
                 'axes': ['THETA', 'HEIGHT'],
@@ -291,25 +302,24 @@ class QXAFS_Scan(XAFS_Scan):
         energy and height. Gathering data is text with columns of
          Theta_Current, Theta_Set, Height_Current, Height_Set
         """
-        angle, height = [], []
-        for line in text.split('\n'):
-            line = line[:-1].strip()
-            if line.startswith('#') or line.startswith(';'):
-                continue
-            if len(line) > 4:
-                words = line[:-1].split()
-                angle.append(float(words[0]))
-                height.append(float(words[2]))
-        # print(" Gather ", len(angle))
-        angle  = np.array(angle)
-        height = np.array(height)
+        # select data lines, and let numpy convert columns 0 and 2 to float
+        words = [line.split() for line in text.split('\n')
+                 if (len(line[:-1].strip()) > 4 and
+                     not line.lstrip().startswith(('#', ';')))]
+        data = np.array([(w[0], w[2]) for w in words],
+                        dtype=np.float64).reshape(-1, 2)
+        # print(" Gather ", len(data))
+        angle, height = data[:, 0], data[:, 1]
         angle  = (angle[1:] + angle[:-1])/2.0
         height = (height[1:] + height[:-1])/2.0
 
-        qconf = self.config
-        angle += caget(qconf['theta_motor'] + '.OFF')
-        dspace = caget(qconf['dspace_pv'])
-        energy = HC/(2.0 * dspace * np.sin(angle/RAD2DEG))
+        angle += self.mono_pvs['theta_off'].get()
+        dspace = self.mono_pvs['dspace'].get()
+        # energy = HC/(2*dspace*sin(angle)), computed in place on angle
+        angle /= RAD2DEG
+        np.sin(angle, out=angle)
+        angle *= 2.0 * dspace
+        energy = np.divide(HC, angle, out=angle)
         return (energy, height)
 
 
@@ -343,19 +353,26 @@ class QXAFS_Scan(XAFS_Scan):
         if self.with_id:
             idenergy_orig = caget(qconf['id_drive_pv'])
             id_offset = 1000.0*caget(qconf['id_offset_pv'])
-            idarray = 1.e-3*(1.0+id_offset/energy_orig)*traj['energy']
-            idarray = np.concatenate((idarray, idarray[-1]+np.arange(1,26)/250.0))
+            # ID energies for the trajectory, plus 25 points past the end
+            nid = len(traj['energy'])
+            idarray = np.empty(nid+25)
+            np.multiply(1.e-3*(1.0+id_offset/energy_orig), traj['energy'],
+                        out=idarray[:nid])
+            np.divide(np.arange(1, 26), 250.0, out=idarray[nid:])
+            idarray[nid:] += idarray[nid-1]
         dtimer.add('idarray')
         time.sleep(0.025)
 
         self.orig_positions = {}
+        energy_pvname = normalize_pvname(qconf['energy_pv'])
         for p in self.positioners:
             thispv = p.pv.pvname
-            retval = p.current()
-            if normalize_pvname(p.pv.pvname) == normalize_pvname(qconf['energy_pv']):
+            if normalize_pvname(thispv) == energy_pvname:
                 retval = energy_orig
                 if retval < self.e0:
                     retval = 25.0*(int((self.e0*1.01)/25.0 + 1))
+            else:
+                retval = p.current()
             if thispv not in self.orig_positions:
                 self.orig_positions[thispv] = retval-0.5
 
@@ -408,10 +425,6 @@ class QXAFS_Scan(XAFS_Scan):
             pass
         caput(qconf['energy_pv'],  traj['energy'][0]-0.5, wait=False)
 
-        extra_vals = []
-        for desc, pv in self.extra_pvs:
-            extra_vals.append((desc, pv.get(as_string=True), pv.pvname))
-
         print("move energy to start: ", qconf['energy_pv'],  traj['energy'][0]-0.5)
         caput(qconf['energy_pv'],  traj['energy'][0]-0.5, wait=True)
         self.xps.arm_trajectory('qxafs', verbose=False, move_to_start=True)
@@ -420,17 +433,19 @@ class QXAFS_Scan(XAFS_Scan):
         dtimer.add('init scandata')
         self.scandb.set_info('qxafs_running', 1)
 
-        for det in self.detectors:
+        def arm_detector(det):
             det.arm(mode=ROI_MODE, numframes=1+traj['npulses'], fnum=0, wait=False)
             det.config_filesaver(path=xrfdir)
+
+        # arm detectors concurrently, re-raising any arming errors
+        with ThreadPoolExecutor(max_workers=max(1, len(self.detectors)),
+                                thread_name_prefix='qxafs_arm') as pool:
+            list(pool.map(arm_detector, self.detectors))
         time.sleep(det_arm_delay)
 
         # wait for detectors to be armed
-        tout = time.time()+2.0
-        while not all([det.arm_complete for det in self.detectors]):
-            if time.time() > tout:
-                break
-            time.sleep(0.01)
+        if not self.wait_for_arm(timeout=2.0):
+            self.write('Warning: detectors not armed after 2 sec\n')
 
         dtimer.add('detectors armed %.4f / %.4f' % (det_arm_delay, det_start_delay))
         for det in reversed(self.detectors):
@@ -476,12 +491,14 @@ class QXAFS_Scan(XAFS_Scan):
             scan_thread.start()
             dtimer.add('scan trajectory started')
             join_time = time.monotonic() + estimated_scantime - 5.0
-            time.sleep(2.0)
-            while scan_thread.is_alive():
-                time.sleep(1.0)
-                if time.monotonic() > join_time:
+            # wait on the trajectory thread itself, so that polling stops
+            # as soon as the trajectory finishes, checking for an abort
+            # request once a second until near the expected end of scan
+            scan_thread.join(timeout=2.0)
+            while scan_thread.is_alive() and time.monotonic() < join_time:
+                scan_thread.join(timeout=1.0)
+                if not scan_thread.is_alive():
                     break
-
                 if self.scandb.get_info(key='request_abort', as_bool=True):
                     self.write("aborting QXAFS scan")
                     abort_proc = create_xps_abort(qconf)
@@ -523,15 +540,16 @@ class QXAFS_Scan(XAFS_Scan):
         else:
             energy = self.energy_pos.array[:-2]
             print("#Warning: will use theoretical energies ", npulses, len(energy))
-        self.pos_actual = []
-        for e in energy:
-           self.pos_actual.append([e])
+        self.pos_actual = [[e] for e in energy.tolist()]
         ne = len(energy)
 
-        for det in self.detectors:
+        def stop_detector(det):
             det.stop()
             det.apply_offsets()
-            dtimer.add(f'det stopped {det.label}')
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.detectors)),
+                                thread_name_prefix='qxafs_stop') as pool:
+            list(pool.map(stop_detector, self.detectors))
 
         dtimer.add('detectors stopped')
         self.finish_qscan()
@@ -541,42 +559,57 @@ class QXAFS_Scan(XAFS_Scan):
         # self.check_outputs(out, msg='post scan')
         dtimer.add('check outputs')
         time.sleep(0.05)
-        db_data = {}
-        for row in self.scandb.get_scandata():
-            db_data[row.name.lower()] = row.data
+        db_data = {row.name.lower(): row.data
+                   for row in self.scandb.get_scandata()}
         dtimer.add(f'read scandb data')
 
-        for c in self.counters:
-            label = c.label.lower()
+        labels = [c.label.lower() for c in self.counters]
+        for c, label in zip(self.counters, labels):
             c.read()
             # effectively looking for missing data:
             if label in db_data and len(c.buff) < len(db_data[label])-5:
-                c.buff = db_data[label][:]
+                c.buff = db_data[label]
                 # print('using data from database  for ' , label)
 
         ndat = [len(c.buff[1:]) for c in self.counters]
         narr = min(ndat)
 
         dtimer.add(f'read counters 1 ({narr}, {ne})')
+        # re-read only counters still missing points,
+        # polling quickly at first, backing off to 0.1 sec
+        waiting = [c for c in self.counters if len(c.buff) < ne]
         t0  = time.monotonic()
-        while narr < (ne-1) and (time.monotonic()-t0) < 5.0:
-            time.sleep(0.1)
-            [c.read() for c in self.counters]
-            ndat = [len(c.buff[1:]) for c in self.counters]
-            narr = min(ndat)
+        delay = 0.005
+        while len(waiting) > 0 and (time.monotonic()-t0) < 5.0:
+            time.sleep(delay)
+            delay = min(0.1, 2*delay)
+            for c in waiting:
+                c.read()
+            waiting = [c for c in waiting if len(c.buff) < ne]
+        ndat = [len(c.buff[1:]) for c in self.counters]
         dtimer.add(f'read counters 2 [{min(ndat)}, {max(ndat)}])')
 
-        mca_offsets = {}
-        counter_buffers = []
-        for c in self.counters:
-            label = c.label.lower()
-            if 'mca' in label and 'clock' in label:
-                buff = np.array(c.read())
-                offset = 1
-                if buff[0] == 0 and buff[1] > 1.10*(buff[2:-1].mean()):
-                    offset = 2
-                key = label.replace('clock', '').strip()
-                mca_offsets[key] = offset
+        # convert buffers to arrays (using net buffers when complete), find
+        # each counter's MCA, and the first-pixel offsets from MCA clocks
+        mca_offsets, mca_keys = {}, []
+        for c, label in zip(self.counters, labels):
+            key = None
+            if 'mca' in label:
+                key = ' '
+                for word in label.split():
+                    if word.startswith('mca'):
+                        key = word
+                if 'clock' in label:
+                    buff = np.asarray(getattr(c, 'net_buff', c.buff))
+                    offset = 1
+                    if buff[0] == 0 and buff[1] > 1.10*(buff[2:-1].mean()):
+                        offset = 2
+                    mca_offsets[label.replace('clock', '').strip()] = offset
+            mca_keys.append(key)
+            if hasattr(c, 'net_buff'):
+                if len(c.net_buff) > len(c.buff)-2:
+                    c.buff = np.array(c.net_buff)
+            c.buff = np.asarray(c.buff)
 
         # print("Read QXAFS Data %i points (NE=%i) %.3f secs" % (narr, ne,
         #         time.monotonic() - t0))
@@ -584,28 +617,17 @@ class QXAFS_Scan(XAFS_Scan):
 
         # remove hot first pixel AND align to proper energy
         # really, we tested this, comparing to slow XAFS scans!
-        data4calcs = {}
-        for c in self.counters:
-            offset = 1
-            label = c.label.lower()
-            if 'mca' in label:
-                words = label.split()
-                key = ' '
-                for word in words:
-                    if word.startswith('mca'):
-                        key = word
-                offset = mca_offsets.get(key, 1)
-            if hasattr(c, 'net_buff'):
-                if len(c.net_buff) > len(c.buff)-2:
-                    c.buff = c.net_buff[:]
-            c.buff = c.buff[offset:]
-            c.buff = c.buff[:ne]
+        for c, key in zip(self.counters, mca_keys):
+            offset = 1 if key is None else mca_offsets.get(key, 1)
+            c.buff = c.buff[offset:offset+ne]
             # print(" READ-> ", c.label, offset, len(c.buff),
             #       c.buff[:3], c.buff[-2:], hasattr(c, 'net_buff'))
-            data4calcs[c.pvname] = np.array(c.buff)
 
-        for c in self.counters:
-            if c.pvname.startswith(EVAL4PLOT):
+        eval_counters = [c for c in self.counters if c.pvname.startswith(EVAL4PLOT)]
+        if len(eval_counters) > 0:
+            # calculated counters may alter their input arrays: give them copies
+            data4calcs = {c.pvname: c.buff.copy() for c in self.counters}
+            for c in eval_counters:
                 _counter = eval(c.pvname[len(EVAL4PLOT):])
                 _counter.data = data4calcs
                 c.buff = _counter.read()